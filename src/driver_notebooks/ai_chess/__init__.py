@@ -1,10 +1,165 @@
+import ast
 import enum
+import inspect
+import json
+import math
+import sys
 import time
 import chess
-from IPython.display import display, HTML, clear_output
 import random
-import chess.engine
-import requests
+
+
+class Clock:
+    """
+    Game clock with a base time and a per-move increment for both players.
+    """
+
+    def __init__(self, base, increment=0):
+        """
+        clock constructor.
+        :param base: float seconds each player starts with.
+        :param increment: float seconds added after every completed move.
+               default is 0.
+        """
+        self.base = base
+        self.increment = increment
+        self.times = {chess.WHITE: base, chess.BLACK: base}
+
+    def remaining(self, color):
+        """
+        time left on a player's clock.
+        :param color: boolean python-chess color.
+        :return: float seconds.
+        """
+        return self.times[color]
+
+    def charge(self, color, elapsed):
+        """
+        deducts the time a player spent on a move and adds the increment.
+        :param color: boolean python-chess color.
+        :param elapsed: float seconds spent on the move.
+        :return: boolean False if the player ran out of time.
+        """
+        self.times[color] -= elapsed
+        if self.times[color] < 0:
+            return False
+        self.times[color] += self.increment
+        return True
+
+
+class SPRT:
+    """
+    Sequential probability ratio test on game pairs.
+
+    Pairs are played with colors swapped, so the pair score (0, 0.25, 0.5,
+    0.75 or 1) follows a pentanomial distribution. The log-likelihood ratio
+    of H1 (elo = elo1) against H0 (elo = elo0) uses the normal approximation
+    of the generalized SPRT with logistic elo.
+    """
+
+    # lowest pair score variance used, that of evenly matched agents drawing
+    # half of their games
+    VARIANCE_FLOOR = 1 / 16
+
+    def __init__(self, elo0=0, elo1=50, alpha=0.05, beta=0.05):
+        """
+        sprt constructor.
+        :param elo0: float elo difference of the null hypothesis.
+               default is 0.
+        :param elo1: float elo difference of the alternative hypothesis.
+               default is 50.
+        :param alpha: float probability of accepting H1 when H0 is true.
+               default is 0.05.
+        :param beta: float probability of accepting H0 when H1 is true.
+               default is 0.05.
+        """
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower_bound = math.log(beta / (1 - alpha))
+        self.upper_bound = math.log((1 - beta) / alpha)
+        # pair counts for the pair scores 0, 0.25, 0.5, 0.75 and 1
+        self.pairs = [0, 0, 0, 0, 0]
+
+    def add_pair(self, score1, score2):
+        """
+        records the scores of one color-swapped pair of games.
+        :param score1: float score (1, 0.5 or 0) of the tested agent in game 1.
+        :param score2: float score (1, 0.5 or 0) of the tested agent in game 2.
+        """
+        self.pairs[int(round((score1 + score2) * 2))] += 1
+
+    def expected_score(self, elo):
+        """
+        logistic expected score of an elo difference.
+        :param elo: float elo difference.
+        :return: float expected score.
+        """
+        return 1 / (1 + 10 ** (-elo / 400))
+
+    def score_elo(self, score):
+        """
+        logistic elo difference of an expected score.
+        :param score: float expected score.
+        :return: float elo difference.
+        """
+        score = min(max(score, 1e-6), 1 - 1e-6)
+        return -400 * math.log10(1 / score - 1)
+
+    def mean_variance(self):
+        """
+        mean and variance of the pair score.
+        :return: tuple (number of pairs, mean, variance).
+        """
+        total = sum(self.pairs)
+        scores = [i / 4 for i in range(5)]
+        mean = sum(n * s for n, s in zip(self.pairs, scores)) / max(total, 1)
+        variance = sum(n * (s - mean) ** 2 for n, s in zip(self.pairs, scores)) / max(total, 1)
+        # a few identical pairs measure a variance near zero, which would
+        # decide the test on them alone
+        return (total, mean, max(variance, self.VARIANCE_FLOOR))
+
+    def llr(self):
+        """
+        log-likelihood ratio of H1 against H0.
+        :return: float llr.
+        """
+        n, mean, variance = self.mean_variance()
+        s0 = self.expected_score(self.elo0)
+        s1 = self.expected_score(self.elo1)
+        return n * (s1 - s0) * (2 * mean - s0 - s1) / (2 * variance)
+
+    def elo(self, z=1.96):
+        """
+        elo difference estimate with its confidence interval.
+        :param z: float normal quantile of the interval.
+               default is 1.96, a 95% interval.
+        :return: tuple (elo, lower, upper).
+        """
+        n, mean, variance = self.mean_variance()
+        error = z * math.sqrt(variance / max(n, 1))
+        return (self.score_elo(mean),
+                self.score_elo(mean - error),
+                self.score_elo(mean + error))
+
+    def los(self):
+        """
+        likelihood of superiority of the tested agent.
+        :return: float probability.
+        """
+        n, mean, variance = self.mean_variance()
+        return 0.5 * (1 + math.erf((mean - 0.5) / math.sqrt(2 * variance / max(n, 1))))
+
+    def status(self):
+        """
+        decision of the test.
+        :return: str "H1" if accepted, "H0" if rejected, None to continue.
+        """
+        llr = self.llr()
+        if llr >= self.upper_bound:
+            return "H1"
+        if llr <= self.lower_bound:
+            return "H0"
+        return None
 
 
 class Game:
@@ -50,6 +205,29 @@ class Game:
             uci = None
         return uci
 
+    def ask_agent(self, agent, board, clock):
+        """
+        Asks an agent for its move, handing over the clock if it accepts one.
+        :param agent: agent function that takes board, return uci move.
+        :param board: a python-chess board.
+        :param clock: Clock of the game or None.
+        :return: str representation of Universal Chess Interface (UCI) move.
+        """
+        if clock is not None and "clock" in inspect.signature(agent).parameters:
+            return agent(board, clock=clock)
+        return agent(board)
+
+    def time_forfeit(self, board, flagged):
+        """
+        Result of a game lost on time.
+        :param board: a python-chess board.
+        :param flagged: boolean python-chess color that ran out of time.
+        :return: tuple (game_has_winner, msg).
+        """
+        if board.has_insufficient_material(not flagged):
+            return (False, "draw: timeout vs insufficient material")
+        return (not flagged, "time forfeit: " + self.who(not flagged) + " wins!")
+
     def count_pieces(self, board):
         """
         Tallies the white and black players pieces.
@@ -80,7 +258,8 @@ class Game:
                   agent2,
                   board_state=None,
                   visual="svg",
-                  pause=0.001):
+                  pause=0.001,
+                  time_control=None):
         """
         Plays a single game with two agent players.
 
@@ -96,6 +275,9 @@ class Game:
         :param pause: time in between turns, can be used to speed up visual html
                animation.
                default is 0.001.
+        :param time_control: tuple (base, increment) in seconds, a player whose
+               clock runs out loses on time.
+               default is None.
         :return: tuple (game_has_winner, msg, board)
         """
 
@@ -106,18 +288,27 @@ class Game:
         else:
             board = chess.Board(board_state)
 
+        clock = Clock(*time_control) if time_control is not None else None
+        flagged = None
+
         try:
             while not board.is_game_over(claim_draw=True):
+                start = time.time()
                 if board.turn == chess.WHITE:
-                    uci = agent1(board)
+                    uci = self.ask_agent(agent1, board, clock)
                 else:
-                    uci = agent2(board)
+                    uci = self.ask_agent(agent2, board, clock)
+                if clock is not None and not clock.charge(board.turn, time.time() - start):
+                    flagged = board.turn
+                    break
                 name = self.who(board.turn)
                 board.push_uci(uci)
-                board_stop = self.display_board(board, use_svg)
-                html = "<b>Move %s %s, Play '%s':</b><br/>%s" % (
-                    len(board.move_stack), name, uci, board_stop)
                 if visual is not None:
+                    # IPython is only needed when games are shown
+                    from IPython.display import display, HTML, clear_output
+                    board_stop = self.display_board(board, use_svg)
+                    html = "<b>Move %s %s, Play '%s':</b><br/>%s" % (
+                        len(board.move_stack), name, uci, board_stop)
                     if visual == "svg":
                         clear_output(wait=True)
                     display(HTML(html))
@@ -127,7 +318,9 @@ class Game:
             msg = "Game interrupted!"
             return (False, msg, board)
         game_has_winner = False
-        if board.is_checkmate():
+        if flagged is not None:
+            game_has_winner, msg = self.time_forfeit(board, flagged)
+        elif board.is_checkmate():
             msg = "checkmate: " + self.who(not board.turn) + " wins!"
             game_has_winner = not board.turn
         elif board.is_stalemate():
@@ -149,7 +342,9 @@ class Game:
             iterations,
             board_state=None,
             visual="svg",
-            pause=0.001):
+            pause=0.001,
+            time_control=None,
+            archive=None):
         """
         Driver allows for two agent players to play multiple games for a
         provided number of iterations.
@@ -167,6 +362,11 @@ class Game:
         :param pause: time in between turns, can be used to speed up visual html
                animation.
                default is 0.001.
+        :param time_control: tuple (base, increment) in seconds, a player whose
+               clock runs out loses on time.
+               default is None.
+        :param archive: ai_chess.archive.ArchiveWriter every game is appended to.
+               default is None.
         :return: Returns a list of tuples representing scores.
         """
         agent1_name = agent1.name
@@ -183,7 +383,8 @@ class Game:
                                             agent2.agent,
                                             board_state,
                                             visual,
-                                            pause)
+                                            pause,
+                                            time_control)
 
             game_hase_winner = terminal_state[0]
             msg = terminal_state[1]
@@ -192,6 +393,10 @@ class Game:
             remaining_b_pieces = self.count_pieces(terminal_state[2])[1]
             remaining_tot_pieces = remaining_w_pieces + remaining_b_pieces
 
+            if archive is not None:
+                archive.add_game(terminal_state[2], agent1_name, agent2_name, depth,
+                                 self.result_string(game_hase_winner, msg))
+
             result_list = (round_num + 1,
                            iterations,
                            depth,
@@ -213,7 +418,9 @@ class Game:
                         engine_agent,
                         uci_start_state=None,
                         visual="svg",
-                        pause=0.001
+                        pause=0.001,
+                        time_control=None,
+                        agent_color=chess.WHITE
                         ):
         """
         Plays a single game with two agent players.
@@ -230,8 +437,15 @@ class Game:
         :param pause: time in between turns, can be used to speed up visual html
                animation.
                default is 0.001.
+        :param time_control: tuple (base, increment) in seconds shared by both
+               players, a player whose clock runs out loses on time. Without it
+               the engine gets 0.1 seconds per move.
+               default is None.
+        :param agent_color: boolean python-chess color played by agent1.
+               default is chess.WHITE.
         :return: tuple (game_has_winner, msg, board)
         """
+        import chess.engine
 
         use_svg = (visual == "svg")
 
@@ -241,26 +455,41 @@ class Game:
         else:
             board = chess.Board(uci_start_state)
 
+        clock = Clock(*time_control) if time_control is not None else None
+        flagged = None
+
         # engine_result_data = list()
 
         try:
             while not board.is_game_over(claim_draw=True):
 
-                if board.turn == chess.WHITE:
+                start = time.time()
+                if board.turn == agent_color:
 
-                    uci = agent1(board)
+                    uci = self.ask_agent(agent1, board, clock)
 
                 else:
 
-                    result = engine_agent.play(board, chess.engine.Limit(time=0.1))
+                    if clock is None:
+                        limit = chess.engine.Limit(time=0.1)
+                    else:
+                        limit = chess.engine.Limit(white_clock=clock.remaining(chess.WHITE),
+                                                   black_clock=clock.remaining(chess.BLACK),
+                                                   white_inc=clock.increment,
+                                                   black_inc=clock.increment)
+                    result = engine_agent.play(board, limit)
                     uci = result.move.uci()
                     # engine_result_data.append(result)
 
+                if clock is not None and not clock.charge(board.turn, time.time() - start):
+                    flagged = board.turn
+                    break
                 board.push_uci(uci)
                 name = self.who(board.turn)
-                board_stop = self.display_board(board, use_svg)
-                html = "<b>Move %s %s, Play '%s':</b><br/>%s" % (len(board.move_stack), name, uci, board_stop)
                 if visual is not None:
+                    from IPython.display import display, HTML, clear_output
+                    board_stop = self.display_board(board, use_svg)
+                    html = "<b>Move %s %s, Play '%s':</b><br/>%s" % (len(board.move_stack), name, uci, board_stop)
                     if visual == "svg":
                         clear_output(wait=True)
                     display(HTML(html))
@@ -271,7 +500,9 @@ class Game:
             msg = "Game interrupted!"
             return (False, msg, board)
         game_has_winner = False
-        if board.is_checkmate():
+        if flagged is not None:
+            game_has_winner, msg = self.time_forfeit(board, flagged)
+        elif board.is_checkmate():
             msg = "checkmate: " + self.who(not board.turn) + " wins!"
             game_has_winner = not board.turn
         elif board.is_stalemate():
@@ -295,7 +526,9 @@ class Game:
                     iterations,
                     uci_start_state=None,
                     visual="svg",
-                    pause=0.001
+                    pause=0.001,
+                    time_control=None,
+                    archive=None
                     ):
         """
         Driver allows for two agent players to play multiple games for a
@@ -314,8 +547,14 @@ class Game:
         :param pause: time in between turns, can be used to speed up visual html
                animation.
                default is 0.001.
+        :param time_control: tuple (base, increment) in seconds, a player whose
+               clock runs out loses on time.
+               default is None.
+        :param archive: ai_chess.archive.ArchiveWriter every game is appended to.
+               default is None.
         :return: Returns a list of tuples representing scores.
         """
+        import chess.engine
         agent1_name = agent1.name
         engine_name = "stockfish"
 
@@ -335,7 +574,8 @@ class Game:
                                                     engine_agent,
                                                     uci_start_state,
                                                     visual,
-                                                    pause
+                                                    pause,
+                                                    time_control
                                                     )
 
             game_hase_winner = terminal_state[0]
@@ -345,6 +585,10 @@ class Game:
             remaining_b_pieces = self.count_pieces(terminal_state[2])[1]
             remaining_tot_pieces = remaining_w_pieces + remaining_b_pieces
 
+            if archive is not None:
+                archive.add_game(terminal_state[2], agent1_name, engine_name, depth,
+                                 self.result_string(game_hase_winner, msg))
+
             # key = "round:" + str(round_num + 1) + "_of:" + str(iterations) + "_depth:" + str(depth) + "_agent:" + agent1_name + "_engine:" + engine_name
 
             # engine_data_dict[key] = engine_data
@@ -365,6 +609,183 @@ class Game:
 
         return scores_list
 
+    def result_string(self, game_has_winner, msg):
+        """
+        PGN result of a finished game.
+        :param game_has_winner: boolean True if white won.
+        :param msg: str result message of the game.
+        :return: str "1-0" | "0-1" | "1/2-1/2" | "*".
+        """
+        if msg == "Game interrupted!":
+            return "*"
+        if msg.startswith("draw"):
+            return "1/2-1/2"
+        return "1-0" if game_has_winner else "0-1"
+
+    def game_score(self, game_has_winner, msg, color):
+        """
+        Score of a finished game for one player.
+        :param game_has_winner: boolean True if white won.
+        :param msg: str result message of the game.
+        :param color: boolean python-chess color of the player.
+        :return: float 1 for a win, 0.5 for a draw, 0 for a loss.
+        """
+        if msg.startswith("draw"):
+            return 0.5
+        white_won = bool(game_has_winner)
+        return 1.0 if white_won == (color == chess.WHITE) else 0.0
+
+    def run_sprt(self,
+                 agent1,
+                 agent2,
+                 elo0=0,
+                 elo1=50,
+                 alpha=0.05,
+                 beta=0.05,
+                 max_pairs=100,
+                 min_pairs=5,
+                 board_state=None,
+                 visual=None,
+                 pause=0.001,
+                 time_control=None,
+                 archive=None):
+        """
+        Driver plays color-alternating pairs of games between agent1 and an
+        opponent until a sequential probability ratio test accepts or rejects
+        that agent1 is elo1 rather than elo0 stronger.
+
+        :param agent1: agent object under test.
+        :param agent2: opponent agent object, or str path of a UCI engine
+               executable such as stockfish.
+        :param elo0: float elo difference of the null hypothesis.
+               default is 0.
+        :param elo1: float elo difference of the alternative hypothesis.
+               default is 50.
+        :param alpha: float false positive rate.
+               default is 0.05.
+        :param beta: float false negative rate.
+               default is 0.05.
+        :param max_pairs: int maximum number of game pairs.
+               default is 100.
+        :param min_pairs: int number of pairs played before a decision is
+               accepted.
+               default is 5.
+        :param board_state: str representing the board state in FEN standard.
+               default is None.
+        :param visual: indicates if visual html animation of board active.
+               default is None.
+               available options: "svg" | "simple" | None
+        :param pause: time in between turns, can be used to speed up visual html
+               animation.
+               default is 0.001.
+        :param time_control: tuple (base, increment) in seconds, a player whose
+               clock runs out loses on time.
+               default is None.
+        :param archive: ai_chess.archive.ArchiveWriter every game is appended to.
+               default is None.
+        :return: Returns a list of tuples with the run/run_engine result columns
+                followed by the agent1 score, elo, elo lower bound, elo upper
+                bound (95% confidence), los, llr and the test status ("H1",
+                "H0" or None) after the game's pair.
+        """
+        import chess.engine
+        use_engine = isinstance(agent2, str)
+        agent1_name = agent1.name
+        agent2_name = "stockfish" if use_engine else agent2.name
+        iterations = 2 * max_pairs
+        sprt = SPRT(elo0, elo1, alpha, beta)
+        scores_list = list()
+
+        depth = None
+
+        if "minimax" in agent1_name:
+            depth = agent1.get_max_depth()
+
+        for pair_num in range(max_pairs):
+            pair = list()
+            for agent1_color in (chess.WHITE, chess.BLACK):
+                if use_engine:
+                    engine_agent = chess.engine.SimpleEngine.popen_uci(agent2)
+                    terminal_state = self.play_game_engine(agent1.agent,
+                                                            engine_agent,
+                                                            board_state,
+                                                            visual,
+                                                            pause,
+                                                            time_control,
+                                                            agent1_color)
+                elif agent1_color == chess.WHITE:
+                    terminal_state = self.play_game(agent1.agent,
+                                                    agent2.agent,
+                                                    board_state,
+                                                    visual,
+                                                    pause,
+                                                    time_control)
+                else:
+                    terminal_state = self.play_game(agent2.agent,
+                                                    agent1.agent,
+                                                    board_state,
+                                                    visual,
+                                                    pause,
+                                                    time_control)
+                if terminal_state[1] == "Game interrupted!":
+                    return scores_list
+                pair.append((agent1_color, terminal_state))
+
+            sprt.add_pair(*[self.game_score(state[0], state[1], color) for color, state in pair])
+            elo, elo_lower, elo_upper = sprt.elo()
+            status = sprt.status() if pair_num + 1 >= min_pairs else None
+
+            for game_num, (agent1_color, terminal_state) in enumerate(pair):
+                game_hase_winner = terminal_state[0]
+                msg = terminal_state[1]
+                moves_played = len(terminal_state[2].move_stack)
+                remaining_w_pieces = self.count_pieces(terminal_state[2])[0]
+                remaining_b_pieces = self.count_pieces(terminal_state[2])[1]
+                remaining_tot_pieces = remaining_w_pieces + remaining_b_pieces
+
+                if agent1_color == chess.WHITE:
+                    white_name, black_name = agent1_name, agent2_name
+                else:
+                    white_name, black_name = agent2_name, agent1_name
+
+                if archive is not None:
+                    archive.add_game(terminal_state[2], white_name, black_name, depth,
+                                     self.result_string(game_hase_winner, msg))
+
+                result_list = (2 * pair_num + game_num + 1,
+                               iterations,
+                               depth,
+                               white_name,
+                               black_name,
+                               game_hase_winner,
+                               msg,
+                               moves_played,
+                               remaining_w_pieces,
+                               remaining_b_pieces,
+                               remaining_tot_pieces,
+                               self.game_score(game_hase_winner, msg, agent1_color),
+                               elo,
+                               elo_lower,
+                               elo_upper,
+                               sprt.los(),
+                               sprt.llr(),
+                               status)
+
+                scores_list.append(result_list)
+
+            if status is not None:
+                break
+
+        return scores_list
+
+# material values of the advanced evaluation, also used to order captures
+piece_values = {chess.PAWN: 100,
+                chess.KNIGHT: 320,
+                chess.BISHOP: 330,
+                chess.ROOK: 500,
+                chess.QUEEN: 900,
+                chess.KING: 0}
+
 pawntable = [
     0,  0,  0,  0,  0,  0,  0,  0,
     5, 10, 10, -20, -20, 10, 10, 5,
@@ -425,6 +846,127 @@ kingstable = [
     -30, -40, -40, -50, -50, -40, -40, -30,
     -30, -40, -40, -50, -50, -40, -40, -30]
 
+piece_tables = {chess.PAWN: pawntable,
+                chess.KNIGHT: knightstable,
+                chess.BISHOP: bishopstable,
+                chess.ROOK: rookstable,
+                chess.QUEEN: queenstable,
+                chess.KING: kingstable}
+
+table_names = {"pawntable": chess.PAWN,
+               "knightstable": chess.KNIGHT,
+               "bishopstable": chess.BISHOP,
+               "rookstable": chess.ROOK,
+               "queenstable": chess.QUEEN,
+               "kingstable": chess.KING}
+
+# (piece type, white layers, black layers) where a layer is a tuple
+# (square mask, value + table weight), black layers use mirrored masks and
+# negated weights
+eval_layers = list()
+
+# piece type -> if its table scores a square and its left-right mirror alike,
+# positions may then share cache entries with their mirror images
+mirror_symmetric = dict()
+
+def build_eval_layers():
+    """
+    splits every piece-square table into one bitmask per distinct weight, with
+    the piece value folded into the weight. Called at import and whenever the
+    tables change.
+    """
+    eval_layers[:] = []
+    for piece_type, table in piece_tables.items():
+        masks = dict()
+        for square, value in enumerate(table):
+            weight = value + piece_values[piece_type]
+            if weight:
+                masks[weight] = masks.get(weight, 0) | chess.BB_SQUARES[square]
+        white = tuple((mask, weight) for weight, mask in masks.items())
+        black = tuple((chess.flip_vertical(mask), -weight) for weight, mask in masks.items())
+        eval_layers.append((piece_type, white, black))
+        mirror_symmetric[piece_type] = all(table[square] == table[square ^ 7] for square in range(64))
+    # keep the numpy weights in step if batched evaluation is loaded
+    batch_eval = sys.modules.get(__name__ + ".batch_eval")
+    if batch_eval is not None:
+        batch_eval.build_weights()
+
+def bitboard_score(board):
+    """
+    material and piece-square table score from white's point of view as a
+    weighted sum of popcounts of piece bitboards and weight layers.
+    :param board: a python-chess board.
+    :return: int score value.
+    """
+    popcount = chess.popcount
+    score = 0
+    for piece_type, white, black in eval_layers:
+        pieces = board.pieces_mask(piece_type, chess.WHITE)
+        if pieces:
+            for mask, weight in white:
+                score += weight * popcount(pieces & mask)
+        pieces = board.pieces_mask(piece_type, chess.BLACK)
+        if pieces:
+            for mask, weight in black:
+                score += weight * popcount(pieces & mask)
+    return score
+
+build_eval_layers()
+
+def canonical_key(board, mirror=False):
+    """
+    transposition key shared by a position and its color-flipped twin (board
+    flipped top to bottom, colors and side to move swapped), and with their
+    left-right mirror images when mirror is set and no castling rights are
+    left. Evaluations from white's point of view are negated by the color
+    flip and kept by the mirror when the tables are mirror symmetric.
+    :param board: a python-chess board.
+    :param mirror: boolean if left-right mirror images share the key.
+           default is False.
+    :return: tuple (key, flipped) where flipped tells if key is the one of
+            the color-flipped position.
+    """
+    pawns, knights, bishops, rooks, queens, kings, white, black, turn, castling, ep = \
+        board._transposition_key()
+    if ep is None:
+        ep = -1
+    flip = chess.flip_vertical
+    candidates = [((pawns, knights, bishops, rooks, queens, kings, white, black,
+                    turn, castling, ep), False),
+                  ((flip(pawns), flip(knights), flip(bishops), flip(rooks), flip(queens),
+                    flip(kings), flip(black), flip(white), not turn, flip(castling),
+                    ep ^ 56 if ep >= 0 else ep), True)]
+    if mirror and not castling:
+        flip = chess.flip_horizontal
+        for key, flipped in candidates[:2]:
+            candidates.append((tuple(flip(bb) for bb in key[:8]) + key[8:10] +
+                               (key[10] ^ 7 if key[10] >= 0 else key[10],), flipped))
+    return min(candidates)
+
+# bumped by load_tables, agents drop cached scores of older tables
+table_generation = 0
+
+def load_tables(path):
+    """
+    replaces the piece values and piece-square tables of the advanced
+    evaluation, e.g. with a table set written by ai_chess.tuning. Scores the
+    agents cached with the previous tables are cleared on their next lookup.
+    :param path: str JSON file with a "piece_values" object keyed by piece
+           name and one 64 entry list per table name (pawntable, knightstable,
+           bishopstable, rookstable, queenstable, kingstable).
+    """
+    with open(path) as file:
+        tables = json.load(file)
+    for name, value in tables.get("piece_values", {}).items():
+        piece_values[chess.PIECE_NAMES.index(name)] = value
+    for name, piece_type in table_names.items():
+        if name in tables:
+            # update in place so every reference to the table sees the change
+            piece_tables[piece_type][:] = tables[name]
+    build_eval_layers()
+    global table_generation
+    table_generation += 1
+
 class RandomAgent:
     """
     Random Agent class.
@@ -501,6 +1043,7 @@ class BaseAgent:
             self.name = heuristic + base_name
             self.eval = self.advanced_evaluation
         self.agent = self.choice
+        self.best_score = None
 
     def count_pieces(self, board):
         """
@@ -566,15 +1109,7 @@ class BaseAgent:
             return 9999
         if self.count_pieces(board) <=7:
             eval = 0
-            query = "http://tablebase.lichess.ovh/standard?fen="
-            fen = board.fen()
-            request = query + fen.replace(" ", "_")
-            r = requests.get(request)
-            if r.status_code == 429:
-                time.sleep(1)
-                request = query + fen.replace(" ", "_")
-                r = requests.get(request)
-            wdl = r.json()["wdl"]
+            wdl = probe_wdl(board)
             if wdl is not None:
                 # wdl < 0 if the side to move is losing. This move is preferable
                 # since the opponent's side is losing
@@ -617,15 +1152,7 @@ class BaseAgent:
             return 0
         if self.count_pieces(board) <= 7:
             eval = 0
-            query = "http://tablebase.lichess.ovh/standard?fen="
-            fen = board.fen()
-            request = query + fen.replace(" ", "_")
-            r = requests.get(request)
-            if r.status_code == 429:
-                time.sleep(1)
-                request = query + fen.replace(" ", "_")
-                r = requests.get(request)
-            wdl = r.json()["wdl"]
+            wdl = probe_wdl(board)
             if wdl is not None:
                 # wdl < 0 if the side to move is losing. This move is preferable
                 # since the opponent's side is losing
@@ -646,11 +1173,11 @@ class BaseAgent:
         wq = len(board.pieces(chess.QUEEN,  chess.WHITE))
         bq = len(board.pieces(chess.QUEEN,  chess.BLACK))
 
-        material = 100 * (wp - bp) + \
-                   320 * (wn - bn) + \
-                   330 * (wb - bb) + \
-                   500 * (wr - br) + \
-                   900 * (wq - bq)
+        material = piece_values[chess.PAWN] * (wp - bp) + \
+                   piece_values[chess.KNIGHT] * (wn - bn) + \
+                   piece_values[chess.BISHOP] * (wb - bb) + \
+                   piece_values[chess.ROOK] * (wr - br) + \
+                   piece_values[chess.QUEEN] * (wq - bq)
 
         pawnsq = sum([pawntable[i] for i in board.pieces(chess.PAWN, chess.WHITE)])
         pawnsq = pawnsq + sum([-pawntable[chess.square_mirror(i)] for i in board.pieces(chess.PAWN, chess.BLACK)])
@@ -688,24 +1215,369 @@ class BaseAgent:
             # go through board and return a score
             move.score = self.eval(newboard, move, board.turn)
         moves.sort(key=lambda move: move.score, reverse=True)  # sort on score
+        # scores are from the mover's point of view, best_score from white's
+        self.best_score = moves[0].score if board.turn == chess.WHITE else -moves[0].score
         return moves[0].uci()
 
+class StagedMoveGenerator:
+    """
+    Staged legal move generator for the search.
+
+    Moves are produced in stages: hash move, captures and promotions, killers
+    and finally quiet moves. A stage is only generated once the previous one
+    is exhausted and pseudo-legal moves are only checked for legality when
+    they are about to be yielded, so a node that cuts off on its first move
+    never builds the full legal move list.
+    """
+
+    def __init__(self, board, hash_move=None, killers=()):
+        """
+        staged move generator constructor.
+        :param board: a python-chess board.
+        :param hash_move: python-chess move stored for this position, tried first.
+               default is None.
+        :param killers: python-chess quiet moves that caused a cutoff at the
+               same depth in a sibling node.
+               default is ().
+        """
+        self.board = board
+        self.hash_move = hash_move
+        self.killers = killers
+
+    def __iter__(self):
+        board = self.board
+        hash_move = self.hash_move
+
+        if hash_move is not None:
+            if board.is_legal(hash_move):
+                yield hash_move
+            else:
+                hash_move = None
+
+        if board.is_check():
+            # evasions are already filtered by python-chess, no staging needed
+            for move in board.generate_legal_moves():
+                if move != hash_move:
+                    yield move
+            return
+
+        king = board.king(board.turn)
+        blockers = None
+
+        # captures (including capturing promotions) ordered by mvv-lva
+        captures = list(board.generate_pseudo_legal_captures())
+        captures.sort(key=lambda move: (
+            piece_values[board.piece_type_at(move.to_square) or chess.PAWN],
+            -piece_values[board.piece_type_at(move.from_square)]),
+            reverse=True)
+        for move in captures:
+            if move == hash_move:
+                continue
+            if blockers is None:
+                blockers = board._slider_blockers(king) if king is not None else 0
+            if king is None or board._is_safe(king, blockers, move):
+                yield move
+
+        # quiet promotions
+        pawns = board.pawns & board.occupied_co[board.turn]
+        for move in board.generate_pseudo_legal_moves(pawns, chess.BB_BACKRANKS & ~board.occupied):
+            if move == hash_move:
+                continue
+            if blockers is None:
+                blockers = board._slider_blockers(king) if king is not None else 0
+            if king is None or board._is_safe(king, blockers, move):
+                yield move
+
+        # killers come from sibling positions and need a full legality check
+        tried_killers = []
+        for move in self.killers:
+            if move is None or move == hash_move or move in tried_killers:
+                continue
+            if not move.promotion and not board.is_capture(move) and board.is_legal(move):
+                tried_killers.append(move)
+                yield move
+
+        # remaining quiet moves
+        ep_square = board.ep_square
+        for move in board.generate_pseudo_legal_moves(chess.BB_ALL, ~board.occupied):
+            if move.promotion or move == hash_move or move in tried_killers:
+                continue
+            if move.to_square == ep_square and board.is_en_passant(move):
+                continue
+            if blockers is None:
+                blockers = board._slider_blockers(king) if king is not None else 0
+            if king is None or board._is_safe(king, blockers, move):
+                yield move
+
+        # castling targets the own rook square internally so it is generated
+        # on its own, python-chess already checks the king path is safe
+        for move in board.generate_castling_moves():
+            if move != hash_move and move not in tried_killers:
+                yield move
+
+class SearchStopped(Exception):
+    """
+    Raised inside the search when the agent's stop callback fires.
+    """
+
+class TimeManager:
+    """
+    Splits the remaining clock time into per-move search budgets.
+
+    The soft budget is the time after which no new search iteration is
+    started, the hard budget aborts the running iteration. The soft budget
+    grows while the best move keeps changing or its score swings between
+    iterations.
+    """
+
+    def __init__(self, moves_to_go=40, min_moves_to_go=10, hard_ratio=4.0,
+                 max_fraction=0.5, overhead=0.05):
+        """
+        time manager constructor.
+        :param moves_to_go: int moves expected in a game still to be played
+               from the opening.
+               default is 40.
+        :param min_moves_to_go: int moves always planned for, however far the
+               game has progressed.
+               default is 10.
+        :param hard_ratio: float hard budget as a multiple of the soft budget.
+               default is 4.0.
+        :param max_fraction: float largest fraction of the remaining time a
+               single move may use.
+               default is 0.5.
+        :param overhead: float seconds kept in reserve for move transmission.
+               default is 0.05.
+        """
+        self.moves_to_go = moves_to_go
+        self.min_moves_to_go = min_moves_to_go
+        self.hard_ratio = hard_ratio
+        self.max_fraction = max_fraction
+        self.overhead = overhead
+
+    def budget(self, remaining, increment, move_number):
+        """
+        soft and hard time budgets for one move.
+        :param remaining: float seconds left on the clock.
+        :param increment: float seconds added after the move.
+        :param move_number: int full move number of the position, counted in
+               moves as board.fullmove_number, not in plies.
+        :return: tuple (soft, hard) in seconds.
+        """
+        available = max(remaining - self.overhead, 0)
+        moves_left = max(self.min_moves_to_go, self.moves_to_go - (move_number - 1))
+        hard = available * self.max_fraction
+        soft = min(available / moves_left + increment * 0.75, hard)
+        return (soft, min(soft * self.hard_ratio, hard))
+
+    def adjust(self, soft, hard, best_move_changes, score_swing):
+        """
+        stretches the soft budget while the search is unstable.
+        :param soft: float soft budget in seconds.
+        :param hard: float hard budget in seconds.
+        :param best_move_changes: int times the best move changed between
+               iterations.
+        :param score_swing: float largest score change between iterations.
+        :return: float adjusted soft budget in seconds.
+        """
+        factor = 1 + 0.3 * best_move_changes + min(score_swing, 200) / 400
+        return min(soft * factor, hard)
+
+
+class HashTable:
+    """
+    Fixed size always-replace hash table.
+
+    An entry lives in slot hash(key) % size and is overwritten by the next key
+    mapping to the same slot, the full key is kept so a slot collision is a
+    miss rather than a wrong value. Probes and hits are counted for the hit
+    rate.
+    """
+
+    def __init__(self, size):
+        """
+        hash table constructor.
+        :param size: int number of slots.
+        """
+        self.size = size
+        self.keys = [None] * size
+        self.values = [None] * size
+        self.probes = 0
+        self.hits = 0
+
+    def get(self, key):
+        """
+        looks a key up.
+        :param key: hashable key.
+        :return: stored value or None.
+        """
+        self.probes += 1
+        slot = hash(key) % self.size
+        if self.keys[slot] == key:
+            self.hits += 1
+            return self.values[slot]
+        return None
+
+    def put(self, key, value):
+        """
+        stores a value, replacing whatever was in its slot.
+        :param key: hashable key.
+        :param value: value to store.
+        """
+        slot = hash(key) % self.size
+        self.keys[slot] = key
+        self.values[slot] = value
+
+    def hit_rate(self):
+        """
+        share of probes that were hits.
+        :return: float hit rate, 0 before the first probe.
+        """
+        return self.hits / self.probes if self.probes else 0.0
+
+    def clear(self):
+        """
+        empties the table and resets the counters.
+        """
+        self.keys = [None] * self.size
+        self.values = [None] * self.size
+        self.probes = 0
+        self.hits = 0
+
+# wdl of tablebase positions already probed, shared by every agent
+tablebase_cache = HashTable(65536)
+
+def probe_wdl(board):
+    """
+    win/draw/loss of a position with at most 7 pieces for the side to move.
+    King and pawn, rook or queen against king are read from the local
+    bitbases, everything else is asked from the lichess syzygy tablebase.
+    The value is the same for the color-flipped and mirrored positions, so
+    they share one cache entry.
+    :param board: a python-chess board.
+    :return: int wdl, negative if the side to move is losing, or None if the
+            tablebase has no value for the position.
+    """
+    if chess.popcount(board.occupied) == 3:
+        from ai_chess import bitbase
+        wdl = bitbase.probe(board)
+        if wdl is not None:
+            return wdl
+    key = canonical_key(board, mirror=True)[0]
+    cached = tablebase_cache.get(key)
+    if cached is not None:
+        return cached[0]
+    # requests is only imported once a tablebase is probed
+    import requests
+    query = "http://tablebase.lichess.ovh/standard?fen="
+    request = query + board.fen().replace(" ", "_")
+    r = requests.get(request)
+    if r.status_code == 429:
+        time.sleep(1)
+        r = requests.get(request)
+    wdl = r.json()["wdl"]
+    # wrapped so a position without a value is not probed again
+    tablebase_cache.put(key, (wdl,))
+    return wdl
+
 class MiniMaxAgent:
     """
     Mini-Max Agent class.
     """
 
-    def __init__(self, max_depth=1, heuristic="naive", type="minimax"):
+    def __init__(self, max_depth=1, heuristic="naive", type="minimax",
+                 staged_movegen=True, hash_size=65536, time_manager=None,
+                 batch_threshold=None, eval_cache_size=65536, pawn_cache_size=16384,
+                 book=None, book_depth=None, book_selection="weighted",
+                 mate_search=0, mate_nodes=5000, symmetry=False):
         """
         mini max agent constructor.
         :param max_depth: int maximum state search depth.
         :param heuristic:
            default is "naive"
-           options: "naive" | "improved"
+           options: "naive" | "improved" | "advanced" | "bitboard"
+        :param staged_movegen: boolean if the alpha-beta search generates moves
+           in stages (hash move, captures, killers, quiet moves) instead of
+           building the full legal move list at every node.
+           default is True.
+        :param hash_size: int maximum number of positions kept in the hash move
+           table.
+           default is 65536.
+        :param time_manager: TimeManager used when the agent is given a clock,
+           max_depth then caps the iterative deepening.
+           default is None, a TimeManager with default settings.
+        :param batch_threshold: int smallest number of children of a depth 1
+           node that are evaluated together with numpy (minimax type with the
+           advanced and bitboard heuristics only, alpha-beta would score
+           children its cutoffs skip), smaller nodes are evaluated one at a
+           time.
+           default is None, no batching.
+        :param eval_cache_size: int slots of the static evaluation cache keyed
+           by position (piece placement, side to move, castling and en passant
+           rights, as the Zobrist hash), 0 turns it off. Positions of at most
+           7 pieces are cached by the tablebase probe instead. The improved
+           heuristic is random and never cached.
+           default is 65536.
+        :param pawn_cache_size: int slots of the pawn hash table keyed by the
+           pawn bitboards, caching the pawn terms of advanced_evaluation. 0
+           turns it off.
+           default is 16384.
+        :param book: str Polyglot opening book path or ai_chess.book.OpeningBook
+           consulted before searching.
+           default is None, no book.
+        :param book_depth: int plies from the start of the game the book is
+           used for.
+           default is None, as long as the position is in the book.
+        :param book_selection: str "weighted" picks book moves at random in
+           proportion to their weights, "best" the highest weight.
+           default is "weighted".
+        :param mate_search: int longest mate, in moves, looked for with the
+           proof-number solver before searching when checks are available.
+           default is 0, no mate search.
+        :param mate_nodes: int node budget of each mate search.
+           default is 5000.
+        :param symmetry: boolean if the evaluation and pawn caches share
+           entries between color-flipped positions, and between left-right
+           mirrored ones without castling rights when the tables allow it.
+           Twins rarely meet in one search, so the extra key work usually
+           costs more than the hits it adds.
+           default is False.
         """
         self._max_depth = max_depth
         self.heuristic = heuristic
         self.type = type
+        self.staged_movegen = staged_movegen
+        self.hash_size = hash_size
+        self.hash_moves = dict()
+        self.killers = dict()
+        # nodes visited so far, a search can be aborted by setting stop to a
+        # callable that returns True
+        self.nodes = 0
+        self.stop = None
+        self.best_score = None
+        # root moves with their white point of view scores, best first, of
+        # the last completed search
+        self.root_moves = None
+        self.time_manager = time_manager if time_manager is not None else TimeManager()
+        self.batch_threshold = batch_threshold
+        self.eval_cache = HashTable(eval_cache_size) \
+            if eval_cache_size and heuristic != "improved" else None
+        self.pawn_cache = HashTable(pawn_cache_size) if pawn_cache_size else None
+        self.symmetry = symmetry
+        self.table_generation = table_generation
+        if isinstance(book, str):
+            # numpy is only needed once a book is used
+            from ai_chess.book import load_book
+            book = load_book(book)
+        self.book = book
+        self.book_depth = book_depth
+        self.book_selection = book_selection
+        self.mate_search = mate_search
+        self.mate_nodes = mate_nodes
+        # proven mating line of the last position searched, and its key so
+        # the iterations of a deepening search only run the solver once
+        self.mate_line = None
+        self.mate_distance = None
+        self.mate_key = None
 
         base_name = "_minimax_agent"
 
@@ -720,6 +1592,9 @@ class MiniMaxAgent:
             elif heuristic == "advanced":
                 self.name = heuristic + self.name
                 self.eval = self.advanced_evaluation
+            elif heuristic == "bitboard":
+                self.name = heuristic + self.name
+                self.eval = self.bitboard_evaluation
             self.agent = self.minimax_choice
 
         elif type == "alpha-beta":
@@ -734,6 +1609,9 @@ class MiniMaxAgent:
             elif heuristic == "advanced":
                 self.name = heuristic + "_" + self.name
                 self.eval = self.advanced_evaluation
+            elif heuristic == "bitboard":
+                self.name = heuristic + "_" + self.name
+                self.eval = self.bitboard_evaluation
             self.agent = self.alphabeta_choice
 
     def count_pieces(self, board):
@@ -764,15 +1642,7 @@ class MiniMaxAgent:
         score = 0
         if self.count_pieces(board) <= 7:
             eval = 0
-            query = "http://tablebase.lichess.ovh/standard?fen="
-            fen = board.fen()
-            request = query + fen.replace(" ", "_")
-            r = requests.get(request)
-            if r.status_code == 429:
-                time.sleep(1)
-                request = query + fen.replace(" ", "_")
-                r = requests.get(request)
-            wdl = r.json()["wdl"]
+            wdl = probe_wdl(board)
             if wdl is not None:
                 # wdl < 0 if the side to move is losing. This move is preferable
                 # since the opponent's side is losing
@@ -807,15 +1677,7 @@ class MiniMaxAgent:
                 return 9999
         if self.count_pieces(board) <=7:
             eval = 0
-            query = "http://tablebase.lichess.ovh/standard?fen="
-            fen = board.fen()
-            request = query + fen.replace(" ", "_")
-            r = requests.get(request)
-            if r.status_code == 429:
-                time.sleep(1)
-                request = query + fen.replace(" ", "_")
-                r = requests.get(request)
-            wdl = r.json()["wdl"]
+            wdl = probe_wdl(board)
             if wdl is not None:
                 # wdl < 0 if the side to move is losing. This move is preferable
                 # since the opponent's side is losing
@@ -870,16 +1732,8 @@ class MiniMaxAgent:
         # endgame table base to get the wdl(win/draw/loss) details. This heavily reduces the
         # computation overload on the agent
         if self.count_pieces(board) <=7:
-            eval =0
-            query = "http://tablebase.lichess.ovh/standard?fen="
-            fen = board.fen()
-            request = query + fen.replace(" ", "_")
-            r = requests.get(request)
-            if r.status_code == 429:
-                time.sleep(1)
-                request = query + fen.replace(" ", "_")
-                r = requests.get(request)
-            wdl = r.json()["wdl"]
+            eval = 0
+            wdl = probe_wdl(board)
             if wdl is not None:
                 if wdl < 0:
                     eval += 50
@@ -898,14 +1752,13 @@ class MiniMaxAgent:
         wq = len(board.pieces(chess.QUEEN,  chess.WHITE))
         bq = len(board.pieces(chess.QUEEN,  chess.BLACK))
 
-        material = 100 * (wp - bp) + \
-                   320 * (wn - bn) + \
-                   330 * (wb - bb) + \
-                   500 * (wr - br) + \
-                   900 * (wq - bq)
+        material = piece_values[chess.PAWN] * (wp - bp) + \
+                   piece_values[chess.KNIGHT] * (wn - bn) + \
+                   piece_values[chess.BISHOP] * (wb - bb) + \
+                   piece_values[chess.ROOK] * (wr - br) + \
+                   piece_values[chess.QUEEN] * (wq - bq)
 
-        pawnsq = sum([pawntable[i] for i in board.pieces(chess.PAWN, chess.WHITE)])
-        pawnsq = pawnsq + sum([-pawntable[chess.square_mirror(i)] for i in board.pieces(chess.PAWN, chess.BLACK)])
+        pawnsq = self.pawn_evaluation(board)
 
         knightsq = sum([knightstable[i] for i in board.pieces(chess.KNIGHT, chess.WHITE)])
         knightsq = knightsq + sum([-knightstable[chess.square_mirror(i)] for i in board.pieces(chess.KNIGHT, chess.BLACK)])
@@ -925,6 +1778,101 @@ class MiniMaxAgent:
         eval = material + pawnsq + knightsq + bishopsq + rooksq + queensq + kingsq
         return eval
 
+    def pawn_evaluation(self, board):
+        """
+        pawn piece-square score, looked up in the pawn hash table since the
+        pawn structure rarely changes between leaves.
+        :param board: a python-chess board.
+        :return: int score value.
+        """
+        white = board.pawns & board.occupied_co[chess.WHITE]
+        black = board.pawns & board.occupied_co[chess.BLACK]
+        key = white | black << 64
+        sign = 1
+        if self.table_generation != table_generation:
+            self.clear_caches()
+        if self.pawn_cache is not None:
+            if self.symmetry:
+                # the color-flipped structure scores the negated value
+                candidates = [(key, 1),
+                              (chess.flip_vertical(black) | chess.flip_vertical(white) << 64, -1)]
+                if mirror_symmetric[chess.PAWN]:
+                    candidates += [(chess.flip_horizontal(pawns & chess.BB_ALL) |
+                                    chess.flip_horizontal(pawns >> 64) << 64, sign)
+                                   for pawns, sign in candidates]
+                key, sign = min(candidates)
+            score = self.pawn_cache.get(key)
+            if score is not None:
+                return sign * score
+
+        score = sum([pawntable[i] for i in chess.scan_forward(white)])
+        score = score + sum([-pawntable[chess.square_mirror(i)] for i in chess.scan_forward(black)])
+
+        if self.pawn_cache is not None:
+            self.pawn_cache.put(key, sign * score)
+        return score
+
+    def clear_caches(self):
+        """
+        empties the evaluation and pawn caches, called once the tables they
+        were filled from are replaced by load_tables.
+        """
+        for cache in (self.eval_cache, self.pawn_cache):
+            if cache is not None:
+                cache.clear()
+        self.table_generation = table_generation
+
+    def eval_key(self, board):
+        """
+        evaluation cache key of a position.
+
+        The key is python-chess' transposition key, which covers the same
+        state as chess.polyglot.zobrist_hash but costs a fraction of a leaf
+        evaluation to build instead of half of one, canonicalized with
+        canonical_key when symmetry is on. Positions of at most 7 pieces are
+        scored by the tablebase relative to the side to move and are left to
+        its own cache.
+        :param board: a python-chess board.
+        :return: tuple (key, sign) where sign times the cached score is the
+                score of the position, key is None if it is not cached.
+        """
+        if self.table_generation != table_generation:
+            self.clear_caches()
+        if self.eval_cache is None or chess.popcount(board.occupied) <= 7:
+            return (None, 1)
+        if not self.symmetry:
+            return (board._transposition_key(), 1)
+        key, flipped = canonical_key(board, all(mirror_symmetric.values()))
+        return (key, -1 if flipped else 1)
+
+    def evaluate(self, board):
+        """
+        static evaluation of a leaf through the evaluation cache.
+        :param board: a python-chess board.
+        :return: int score value.
+        """
+        key, sign = self.eval_key(board)
+        if key is None:
+            return self.eval(board)
+        score = self.eval_cache.get(key)
+        if score is None:
+            score = self.eval(board)
+            self.eval_cache.put(key, sign * score)
+            return score
+        return sign * score
+
+    def bitboard_evaluation(self, board):
+        """
+        advanced evaluation with the material and piece-square tables scored
+        by the bitboard kernel, returns the same scores as advanced_evaluation.
+        :param board: a python-chess board.
+        :return: int score value.
+        """
+        if board.is_checkmate() or board.is_stalemate() or \
+                board.is_insufficient_material() or self.count_pieces(board) <= 7:
+            return self.advanced_evaluation(board)
+        return bitboard_score(board)
+
     def get_max_depth(self):
         """
         gets assigned max depth.
@@ -932,6 +1880,68 @@ class MiniMaxAgent:
         """
         return self._max_depth
 
+    def set_max_depth(self, max_depth):
+        """
+        sets max depth.
+        :param max_depth: int maximum state search depth.
+        """
+        self._max_depth = max_depth
+
+    def batch_leaves(self, board, moves, depth):
+        """
+        evaluates the children of a depth 1 minimax node in one vectorized
+        call when batching is on and the node has at least batch_threshold
+        children. Minimax visits every child anyway, so the node counts are
+        the same as unbatched. Mates, draws and tablebase positions are still
+        evaluated one at a time.
+        :param board: a python-chess board.
+        :param moves: iterable of python-chess moves of the node.
+        :param depth: current depth in the search.
+        :return: tuple (moves, scores) where scores lines up with moves, or is
+                None when the children have to be searched one at a time.
+        """
+        if self.batch_threshold is None or depth != 1 or self.type != "minimax" or \
+                self.heuristic not in ("advanced", "bitboard"):
+            return (moves, None)
+        moves = list(moves)
+        if len(moves) < self.batch_threshold:
+            return (moves, None)
+
+        # numpy is only needed once batching is used
+        from ai_chess import batch_eval
+
+        scores = list()
+        batch = list()
+        children = list()
+        for move in moves:
+            self.nodes += 1
+            if self.stop is not None and self.stop():
+                raise SearchStopped()
+            child = board.copy()
+            child.push(move)
+            key, sign = self.eval_key(child)
+            if key is not None:
+                cached = self.eval_cache.get(key)
+                if cached is not None:
+                    scores.append(sign * cached)
+                    continue
+            if child.is_checkmate() or child.is_stalemate() or \
+                    child.is_insufficient_material() or self.count_pieces(child) <= 7:
+                score = self.advanced_evaluation(child)
+                if key is not None:
+                    self.eval_cache.put(key, sign * score)
+                scores.append(score)
+            else:
+                batch.append((len(scores), key, sign))
+                scores.append(None)
+                children.append(child)
+        if children:
+            for (i, key, sign), score in zip(batch, batch_eval.batch_score(children).tolist()):
+                scores[i] = score
+                if key is not None:
+                    self.eval_cache.put(key, sign * score)
+        return (moves, scores)
+
     def minimax_max_value(self, board, currentAgent, depth):
         """
         gets best move for maximizing agent.
@@ -943,11 +1953,14 @@ class MiniMaxAgent:
         """
         bestMove = -9999
 
-        moves = list(board.legal_moves)
-        for move in moves:
-            newboard = board.copy()
-            newboard.push_uci(move.uci())
-            result = self.minimax_decision(newboard, not currentAgent, depth - 1)
+        moves, leaf_scores = self.batch_leaves(board, list(board.legal_moves), depth)
+        for i, move in enumerate(moves):
+            if leaf_scores is not None:
+                result = leaf_scores[i]
+            else:
+                newboard = board.copy()
+                newboard.push_uci(move.uci())
+                result = self.minimax_decision(newboard, not currentAgent, depth - 1)
             if result > bestMove:
                 bestMove = result
         return bestMove
@@ -963,11 +1976,14 @@ class MiniMaxAgent:
         """
         bestMove = 9999
 
-        moves = list(board.legal_moves)
-        for move in moves:
-            newboard = board.copy()
-            newboard.push_uci(move.uci())
-            result = self.minimax_decision(newboard, not currentAgent, depth - 1)
+        moves, leaf_scores = self.batch_leaves(board, list(board.legal_moves), depth)
+        for i, move in enumerate(moves):
+            if leaf_scores is not None:
+                result = leaf_scores[i]
+            else:
+                newboard = board.copy()
+                newboard.push_uci(move.uci())
+                result = self.minimax_decision(newboard, not currentAgent, depth - 1)
             if result < bestMove:
                 bestMove = result
         return bestMove
@@ -981,29 +1997,170 @@ class MiniMaxAgent:
         :param depth: current depth in the search.
         :return: str representation of Universal Chess Interface (UCI) move.
         """
+        self.nodes += 1
+        if self.stop is not None and self.stop():
+            raise SearchStopped()
         if depth == 0:
-            return self.eval(board)
+            return self.evaluate(board)
 
         if currentAgent:
             return self.minimax_max_value(board, currentAgent, depth)
         else:
             return self.minimax_min_value(board, currentAgent, depth)
 
-    def minimax_choice(self, board):
+    def book_move(self, board):
+        """
+        looks the position up in the opening book.
+        :param board: a python-chess board.
+        :return: str representation of Universal Chess Interface (UCI) move or
+                None if there is no book or the position is not in it.
+        """
+        if self.book is None:
+            return None
+        return self.book.choose(board, self.book_selection, self.book_depth)
+
+    def mate_move(self, board):
+        """
+        runs the mate solver on the position.
+        :param board: a python-chess board.
+        :return: str representation of Universal Chess Interface (UCI) move
+                starting a proven mate, or None.
+        """
+        if not self.mate_search:
+            return None
+        key = board._transposition_key()
+        if key != self.mate_key:
+            from ai_chess import mate
+            self.mate_key = key
+            self.mate_line, self.mate_distance = \
+                mate.solve(board, self.mate_search, self.mate_nodes) or (None, None)
+        return self.mate_line[0] if self.mate_line else None
+
+    def timed_choice(self, board, clock):
+        """
+        iteratively deepens the search while the time manager allows it.
+        :param board: a python-chess board.
+        :param clock: Clock of the game.
+        :return: str representation of Universal Chess Interface (UCI) move.
+        """
+        start = time.time()
+        soft, hard = self.time_manager.budget(clock.remaining(board.turn),
+                                              clock.increment,
+                                              board.fullmove_number)
+        max_depth = self.get_max_depth()
+        outer_stop = self.stop
+        self.stop = lambda: (time.time() - start >= hard or
+                             (outer_stop is not None and outer_stop()))
+
+        best = None
+        best_score = None
+        best_move_changes = 0
+        score_swing = 0
+        try:
+            for depth in range(max_depth + 1):
+                self.set_max_depth(depth)
+                move = self.agent(board)
+                if best is not None:
+                    best_move_changes += (move != best)
+                    score_swing = max(score_swing, abs(self.best_score - best_score))
+                best, best_score = move, self.best_score
+                if time.time() - start >= self.time_manager.adjust(soft, hard, best_move_changes, score_swing):
+                    break
+        except SearchStopped:
+            pass
+        finally:
+            self.set_max_depth(max_depth)
+            self.stop = outer_stop
+
+        if best is None:
+            best = next(iter(board.legal_moves)).uci()
+        return best
+
+    def minimax_choice(self, board, clock=None):
         """
         choice selects the best move using the evaluation function.
         :param board: a python-chess board.
+        :param clock: Clock of the game, the search depth is then chosen by
+               the time manager.
+               default is None.
         :return: str representation of Universal Chess Interface (UCI) move.
         """
+        book_move = self.book_move(board)
+        if book_move is not None:
+            self.best_score = None
+            self.root_moves = [(book_move, None)]
+            return book_move
+        mate_move = self.mate_move(board)
+        if mate_move is not None:
+            self.best_score = 9999 if board.turn == chess.WHITE else -9999
+            self.root_moves = [(mate_move, self.best_score)]
+            return mate_move
+        if clock is not None:
+            return self.timed_choice(board, clock)
         start_depth = self.get_max_depth()
         moves = list(board.legal_moves)
         for move in moves:
             newboard = board.copy()
             newboard.push_uci(move.uci())
-            move.score = self.minimax_decision(newboard, False, start_depth)
-        moves.sort(key=lambda move: move.score, reverse=True)  # sort on score
+            move.score = self.minimax_decision(newboard, newboard.turn == chess.WHITE, start_depth)
+        # scores are from white's point of view
+        moves.sort(key=lambda move: move.score, reverse=board.turn == chess.WHITE)  # sort on score
+        self.best_score = moves[0].score
+        self.root_moves = [(move.uci(), move.score) for move in moves]
         return moves[0].uci()
 
+    def ordered_moves(self, board, depth, key):
+        """
+        legal moves of a search node, staged when staged_movegen is active.
+        :param board: a python-chess board.
+        :param depth: current depth in the search.
+        :param key: hash move table key of the position, see node_key.
+        :return: iterable of python-chess moves.
+        """
+        if not self.staged_movegen:
+            return list(board.legal_moves)
+        hash_move = self.hash_moves.get(key)
+        return StagedMoveGenerator(board, hash_move, self.killers.get(depth, ()))
+
+    def node_key(self, board):
+        """
+        hash move table key of a search node, computed once per node. It is
+        python-chess' transposition key, the same state as the Zobrist hash
+        at a fraction of its cost.
+        :param board: a python-chess board.
+        :return: hashable key or None when staged_movegen is off.
+        """
+        return board._transposition_key() if self.staged_movegen else None
+
+    def store_hash_move(self, key, move):
+        """
+        remembers the best move of a position so it is searched first next time.
+        :param key: hash move table key of the position.
+        :param move: python-chess move.
+        """
+        if not self.staged_movegen or move is None:
+            return
+        if len(self.hash_moves) >= self.hash_size:
+            self.hash_moves.clear()
+        self.hash_moves[key] = move
+
+    def store_cutoff(self, board, key, move, depth):
+        """
+        records a move that caused a cutoff as hash move and, if quiet, as killer.
+        :param board: a python-chess board.
+        :param key: hash move table key of the position.
+        :param move: python-chess move.
+        :param depth: current depth in the search.
+        """
+        if not self.staged_movegen:
+            return
+        self.store_hash_move(key, move)
+        if move.promotion or board.is_capture(move):
+            return
+        killers = self.killers.get(depth, ())
+        if move not in killers:
+            self.killers[depth] = (move,) + killers[:1]
+
     def alphabeta_max_value(self, board, currentAgent, depth, alpha, beta):
         """
         gets best move for minimizing alphabeta agent.
@@ -1014,19 +2171,21 @@ class MiniMaxAgent:
         :return: int best score value.
         """
         bestMove = -9999
+        best = None
 
-        moves = list(board.legal_moves)
-        for m in moves:
+        key = self.node_key(board)
+        for m in self.ordered_moves(board, depth, key):
             newboard = board.copy()
-            newboard.push_uci(m.uci())
-
-            alpha = self.alpha
-            beta = self.beta
-
-            bestMove = max(bestMove, self.alphabeta_decision(newboard, not currentAgent, depth - 1, alpha, beta))
+            newboard.push(m)
+            result = self.alphabeta_decision(newboard, not currentAgent, depth - 1, alpha, beta)
+            if result > bestMove:
+                bestMove = result
+                best = m
             if bestMove >= beta:
+                self.store_cutoff(board, key, m, depth)
                 return bestMove
-            self.alpha = max(alpha, bestMove)
+            alpha = max(alpha, bestMove)
+        self.store_hash_move(key, best)
         return bestMove
 
     def alphabeta_min_value(self, board, currentAgent, depth, alpha, beta):
@@ -1039,19 +2198,21 @@ class MiniMaxAgent:
         :return: int best score value.
         """
         bestMove = 9999
+        best = None
 
-        moves = list(board.legal_moves)
-        for m in moves:
+        key = self.node_key(board)
+        for m in self.ordered_moves(board, depth, key):
             newboard = board.copy()
-            newboard.push_uci(m.uci())
-
-            alpha = self.alpha
-            beta = self.beta
-
-            bestMove = min(bestMove, self.alphabeta_decision(newboard, not currentAgent, depth - 1, alpha, beta))
+            newboard.push(m)
+            result = self.alphabeta_decision(newboard, not currentAgent, depth - 1, alpha, beta)
+            if result < bestMove:
+                bestMove = result
+                best = m
             if bestMove <= alpha:
+                self.store_cutoff(board, key, m, depth)
                 return bestMove
-            self.beta = min(self.beta, bestMove)
+            beta = min(beta, bestMove)
+        self.store_hash_move(key, best)
         return bestMove
 
     def alphabeta_decision(self, board, currentAgent, depth, alpha, beta):
@@ -1066,27 +2227,368 @@ class MiniMaxAgent:
         :param beta: int representing the maximum beta value.
         :return: str representation of Universal Chess Interface (UCI) move.
         """
+        self.nodes += 1
+        if self.stop is not None and self.stop():
+            raise SearchStopped()
         if depth == 0:
-            return self.eval(board)
+            return self.evaluate(board)
 
         if currentAgent:
             return self.alphabeta_max_value(board, currentAgent, depth, alpha, beta)
         else:
             return self.alphabeta_min_value(board, currentAgent, depth, alpha, beta)
 
-    def alphabeta_choice(self, board):
+    def alphabeta_choice(self, board, clock=None):
+        """
+        choice selects the best move using alpha-beta pruning.
+        :param board: a python-chess board.
+        :param clock: Clock of the game, the search depth is then chosen by
+               the time manager.
+               default is None.
+        :return: str representation of Universal Chess Interface (UCI) move.
+        """
+        book_move = self.book_move(board)
+        if book_move is not None:
+            self.best_score = None
+            self.root_moves = [(book_move, None)]
+            return book_move
+        mate_move = self.mate_move(board)
+        if mate_move is not None:
+            self.best_score = 9999 if board.turn == chess.WHITE else -9999
+            self.root_moves = [(mate_move, self.best_score)]
+            return mate_move
+        if clock is not None:
+            return self.timed_choice(board, clock)
         start_depth = self.get_max_depth()
+        self.killers = dict()
         moves = list(board.legal_moves)
         for move in moves:
-            self.alpha = -10000
-            self.beta = 10000
+            # a full window per root move keeps every root score exact, so
+            # move ordering inside the tree only changes the speed
             newboard = board.copy()
-            newboard.push_uci(move.uci())
-            move.score = self.alphabeta_decision(newboard, False, start_depth, self.alpha, self.beta)
-        moves.sort(key=lambda move: move.score, reverse=True) # sort on score
+            newboard.push(move)
+            move.score = self.alphabeta_decision(newboard, newboard.turn == chess.WHITE, start_depth, -10000, 10000)
+        # scores are from white's point of view
+        moves.sort(key=lambda move: move.score, reverse=board.turn == chess.WHITE) # sort on score
+        self.best_score = moves[0].score
+        self.root_moves = [(move.uci(), move.score) for move in moves]
         return moves[0].uci()
 
 
+def mcts_playout(fen, playout_depth, seed=None):
+    """
+    plays capture-biased random moves from a position and scores where the
+    playout stops, module level so worker processes can run it.
+    :param fen: str position in FEN standard.
+    :param playout_depth: int plies played before the static evaluation cutoff.
+    :param seed: int random seed of the playout.
+           default is None, the module random state.
+    :return: float expected score for white between 0 and 1.
+    """
+    rng = random.Random(seed) if seed is not None else random
+    board = chess.Board(fen)
+    moves = list(board.legal_moves)
+    for _ in range(playout_depth):
+        if not moves:
+            break
+        captures = [move for move in moves if board.is_capture(move)]
+        board.push(rng.choice(captures or moves))
+        moves = list(board.legal_moves)
+
+    if not moves:
+        if board.is_check():
+            return 0.0 if board.turn == chess.WHITE else 1.0
+        return 0.5
+    if board.is_insufficient_material():
+        return 0.5
+    return 1 / (1 + 10 ** (-bitboard_score(board) / 400))
+
+
+def mcts_playouts(fens, playout_depth, seed):
+    """
+    runs a batch of playouts, so a worker process task is worth its
+    scheduling cost.
+    :param fens: list of str positions in FEN standard.
+    :param playout_depth: int plies played before the static evaluation cutoff.
+    :param seed: int random seed of the batch.
+    :return: list of float expected scores for white.
+    """
+    rng = random.Random(seed)
+    return [mcts_playout(fen, playout_depth, rng.getrandbits(32)) for fen in fens]
+
+
+class MCTSNode:
+    """
+    Node of the Monte-Carlo search tree.
+
+    value sums the playout results from the point of view of the player who
+    played move, the moves not expanded yet are filled in on the first visit.
+    """
+
+    def __init__(self, move=None, parent=None, color=None):
+        """
+        mcts node constructor.
+        :param move: python-chess move leading to the node.
+        :param parent: MCTSNode or None for the root.
+        :param color: boolean color of the player who played move.
+        """
+        self.move = move
+        self.parent = parent
+        self.color = color
+        self.children = list()
+        self.untried = None
+        self.visits = 0
+        self.value = 0.0
+
+
+class MCTSAgent:
+    """
+    Monte-Carlo Tree Search Agent class.
+    """
+
+    def __init__(self, iterations=1000, time_limit=None, playout="capture",
+                 playout_depth=16, exploration=1.4, workers=1, batch_size=8,
+                 virtual_loss=1, reuse_tree=True, time_manager=None):
+        """
+        mcts agent constructor.
+        :param iterations: int playouts per move.
+           default is 1000.
+        :param time_limit: float seconds per move, the search stops at
+           whichever of iterations and time_limit is reached first.
+           default is None, no time limit.
+        :param playout:
+           default is "capture", capture-biased random moves for playout_depth
+           plies then a static evaluation of the last position.
+           options: "capture" | "eval", "eval" scores a new leaf straight away.
+        :param playout_depth: int plies of a capture playout.
+           default is 16.
+        :param exploration: float UCT exploration constant.
+           default is 1.4.
+        :param workers: int playouts run at once in worker processes, 1 runs
+           them in this process.
+           default is 1.
+        :param batch_size: int playouts sent to a worker process at once.
+           default is 8.
+        :param virtual_loss: int losses added along a path while its playout is
+           running so parallel selections spread over the tree.
+           default is 1.
+        :param reuse_tree: boolean if the subtree of the position reached is
+           kept from the previous move.
+           default is True.
+        :param time_manager: TimeManager used when the agent is given a clock.
+           default is None, a TimeManager with default settings.
+        """
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.playout = playout
+        self.playout_depth = playout_depth if playout == "capture" else 0
+        self.exploration = exploration
+        self.workers = workers
+        self.batch_size = batch_size
+        self.virtual_loss = virtual_loss
+        self.reuse_tree = reuse_tree
+        self.time_manager = time_manager if time_manager is not None else TimeManager()
+        self.root = None
+        self.root_fen = None
+        self.root_stack = None
+        self.pool = None
+        self.best_score = None
+        self.name = playout + "_mcts_agent"
+        self.agent = self.choice
+
+    def close(self):
+        """
+        shuts the worker pool down.
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def find_root(self, board):
+        """
+        the node of the position in the tree kept from the previous move.
+        :param board: a python-chess board.
+        :return: MCTSNode, a new one if the position is not in the tree.
+        """
+        stack = board.move_stack
+        if self.reuse_tree and self.root is not None and \
+                stack[:len(self.root_stack)] == self.root_stack and \
+                board.root().fen() == self.root_fen:
+            node = self.root
+            for move in stack[len(self.root_stack):]:
+                node = next((child for child in node.children if child.move == move), None)
+                if node is None:
+                    break
+            if node is not None:
+                node.parent = None
+                return node
+        return MCTSNode()
+
+    def uct(self, node, parent_visits):
+        """
+        upper confidence bound of a child.
+        :param node: MCTSNode child.
+        :param parent_visits: int visits of the parent.
+        :return: float UCT value.
+        """
+        if node.visits == 0:
+            return float("inf")
+        return node.value / node.visits + \
+            self.exploration * math.sqrt(math.log(parent_visits) / node.visits)
+
+    def select(self, root, board):
+        """
+        walks down the tree by UCT and expands one new leaf, adding virtual
+        loss along the path.
+        :param root: MCTSNode of the position.
+        :param board: a python-chess board of the position.
+        :return: tuple (leaf node, str FEN of the leaf).
+        """
+        node = root
+        board = board.copy(stack=False)
+        while True:
+            if node.untried is None:
+                node.untried = list(board.legal_moves)
+            if node.untried:
+                move = node.untried.pop(random.randrange(len(node.untried)))
+                child = MCTSNode(move, node, board.turn)
+                node.children.append(child)
+                board.push(move)
+                node = child
+                break
+            if not node.children:
+                break
+            parent_visits = node.visits
+            node = max(node.children, key=lambda child: self.uct(child, parent_visits))
+            board.push(node.move)
+
+        leaf = node
+        while node is not None:
+            node.visits += self.virtual_loss
+            node = node.parent
+        return (leaf, board.fen())
+
+    def backpropagate(self, node, result):
+        """
+        adds a playout result to the path from a leaf to the root and removes
+        its virtual loss.
+        :param node: MCTSNode leaf.
+        :param result: float expected score for white.
+        """
+        while node is not None:
+            node.visits += 1 - self.virtual_loss
+            node.value += result if node.color == chess.WHITE else 1 - result
+            node = node.parent
+
+    def search(self, root, board, time_limit):
+        """
+        runs playouts until the iteration or time budget is spent, the first
+        playout of an unexpanded root always runs so there is a move to play.
+        :param root: MCTSNode of the position.
+        :param board: a python-chess board of the position.
+        :param time_limit: float seconds or None.
+        """
+        start = time.time()
+
+        def more():
+            if started == 0 and not root.children:
+                return True
+            return started < self.iterations and \
+                (time_limit is None or time.time() - start < time_limit)
+
+        started = 0
+        if self.workers <= 1:
+            while more():
+                leaf, fen = self.select(root, board)
+                self.backpropagate(leaf, mcts_playout(fen, self.playout_depth))
+                started += 1
+            return
+
+        import concurrent.futures
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+        pending = dict()
+        while True:
+            while len(pending) < self.workers and more():
+                leaves = list()
+                fens = list()
+                while len(leaves) < self.batch_size and more():
+                    leaf, fen = self.select(root, board)
+                    leaves.append(leaf)
+                    fens.append(fen)
+                    started += 1
+                future = self.pool.submit(mcts_playouts, fens, self.playout_depth, random.getrandbits(32))
+                pending[future] = leaves
+            if not pending:
+                break
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                for leaf, result in zip(pending.pop(future), future.result()):
+                    self.backpropagate(leaf, result)
+
+    def choice(self, board, clock=None):
+        """
+        choice selects the most visited move after the search.
+        :param board: a python-chess board.
+        :param clock: Clock of the game, the time limit is then chosen by the
+               time manager.
+               default is None.
+        :return: str representation of Universal Chess Interface (UCI) move.
+        """
+        time_limit = self.time_limit
+        if clock is not None:
+            time_limit = self.time_manager.budget(clock.remaining(board.turn),
+                                                  clock.increment,
+                                                  board.fullmove_number)[0]
+        root = self.find_root(board)
+        self.search(root, board, time_limit)
+        if not root.children:
+            # nothing to choose from, e.g. a position without legal moves
+            self.best_score = None
+            return next(iter(board.legal_moves)).uci()
+
+        best = max(root.children, key=lambda child: child.visits)
+        # mean score of the move as centipawns from white's point of view
+        score = min(max(best.value / max(best.visits, 1), 0.001), 0.999)
+        if board.turn == chess.BLACK:
+            score = 1 - score
+        self.best_score = int(round(400 * math.log10(score / (1 - score))))
+
+        self.root = root
+        self.root_fen = board.root().fen()
+        self.root_stack = list(board.move_stack)
+        return best.move.uci()
+
+
+AGENT_CLASSES = {"random": RandomAgent,
+                 "base": BaseAgent,
+                 "minimax": MiniMaxAgent,
+                 "mcts": MCTSAgent}
+
+def make_agent(spec):
+    """
+    builds an agent from a text spec, so agents can be named on a command line
+    or sent to worker processes.
+    :param spec: str "<kind>[:<key>=<value>,...]" where kind is one of
+           random | base | minimax | mcts and the pairs are constructor
+           arguments. Values are read as python literals where they parse as
+           one, e.g. 2, 0.5, True, False or None, and as text otherwise.
+           example: "minimax:max_depth=2,heuristic=advanced,type=alpha-beta"
+    :return: agent object.
+    """
+    kind, _, args = spec.partition(":")
+    kwargs = dict()
+    for pair in filter(None, args.split(",")):
+        key, _, value = pair.partition("=")
+        # numbers, True, False and None get their python types, anything
+        # else is kept as text
+        try:
+            kwargs[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            kwargs[key] = value
+    return AGENT_CLASSES[kind](**kwargs)
+
+
 
 # def main():
 #     # game rounds per match-up
@@ -0,0 +1,111 @@
+"""
+Match runner, the command line counterpart of the driver notebooks.
+
+Plays every agent against every opponent and writes the per game rows with
+the notebook columns to a CSV file. Opponents are agent specs or UCI engine
+paths, agents are built with ai_chess.make_agent.
+
+Run with `python -m ai_chess --help` from the driver_notebooks directory,
+for example
+    python -m ai_chess --agents "minimax:heuristic=advanced,type=alpha-beta"
+                       --opponents random --depths 0,1,2 --iterations 10
+                       --out ./results/minimax_vs_random.csv
+"""
+import argparse
+import concurrent.futures
+import csv
+import sys
+
+from ai_chess.distributed import play_job
+
+# result stats per game, as in the notebooks
+COLUMNS = ['round_num', 'iterations', 'depth', 'white agent', 'black agent', 'white_victory', 'winner',
+           'moves_played', 'remain_w_pieces', 'remaining_b_pieces', 'remaining_tot_pieces']
+
+
+def match_jobs(agents, opponents, iterations=1, depths=None, board_state=None, time_control=None):
+    """
+    one job per pairing of every agent, at every depth, against every opponent.
+    :param agents: list of str agent specs.
+    :param opponents: list of str agent specs or UCI engine paths.
+    :param iterations: int games per pairing.
+           default is 1.
+    :param depths: list of int max_depth values set on minimax agents.
+           default is None, the depth of the spec.
+    :param board_state: str start position in FEN standard or None.
+           default is None.
+    :param time_control: tuple (base, increment) in seconds or None.
+           default is None.
+    :return: list of job dicts for ai_chess.distributed.play_job.
+    """
+    specs = list()
+    for agent in agents:
+        if depths and agent.partition(":")[0] == "minimax":
+            separator = "," if ":" in agent else ":"
+            specs.extend("%s%smax_depth=%d" % (agent, separator, depth) for depth in depths)
+        else:
+            specs.append(agent)
+
+    return [{"id": "%s|%s" % (agent, opponent),
+             "agent": agent,
+             "opponent": opponent,
+             "games": iterations,
+             "board_state": board_state,
+             "time_control": time_control}
+            for agent in specs for opponent in opponents]
+
+
+def run_matches(jobs, workers=1):
+    """
+    plays match jobs, in worker processes when there is more than one.
+    :param jobs: list of job dicts.
+    :param workers: int worker processes.
+           default is 1, games are played in this process.
+    :return: generator of lists of result rows, one per job in job order.
+    """
+    if workers <= 1:
+        for job in jobs:
+            yield play_job(job)
+        return
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        for rows in pool.map(play_job, jobs):
+            yield rows
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m ai_chess",
+                                     description="play agents against agents or UCI engines")
+    parser.add_argument("--agents", required=True, help="semicolon separated agent specs")
+    parser.add_argument("--opponents", required=True, help="semicolon separated agent specs or engine paths")
+    parser.add_argument("--depths", default=None, help="comma separated max_depth values for minimax agents")
+    parser.add_argument("--iterations", type=int, default=1, help="games per pairing")
+    parser.add_argument("--board-state", default=None, help="start position in FEN standard")
+    parser.add_argument("--time-control", default=None, help="base+increment in seconds, e.g. 60+0.5")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--out", default=None, help="CSV results file, default stdout")
+    args = parser.parse_args()
+
+    depths = [int(depth) for depth in args.depths.split(",")] if args.depths else None
+    time_control = None
+    if args.time_control:
+        base, _, increment = args.time_control.partition("+")
+        time_control = (float(base), float(increment or 0))
+    jobs = match_jobs(args.agents.split(";"), args.opponents.split(";"), args.iterations,
+                      depths, args.board_state, time_control)
+
+    out = open(args.out, "w", newline="") if args.out else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(COLUMNS)
+        for job, rows in zip(jobs, run_matches(jobs, args.workers)):
+            writer.writerows(rows)
+            out.flush()
+            if out is not sys.stdout:
+                print("done " + job["id"], flush=True)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Bulk analysis of positions from FEN or EPD files.
+
+Positions are analysed by agents in worker processes. Every worker builds
+its agent once, so hash move tables and evaluation caches stay warm from one
+position to the next. Results are streamed as JSON lines:
+    index   int number of the position in the input, from 0, blank and
+            comment lines are not counted
+    id      str EPD id opcode or None
+    fen     str position
+    best    str best move in uci, None if the position has no legal move
+    score   int centipawn score from white's point of view or None
+    top     list of [uci, score] of the best moves, best first
+    depth   int deepest completed search in plies
+    nodes   int nodes searched
+    time    float seconds spent
+A position that could not be read or whose analysis raised only carries
+index, id, fen and error, fen then being the line as read.
+
+Run with `python -m ai_chess.analysis --help` from the driver_notebooks
+directory.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+import chess
+
+from ai_chess import SearchStopped, make_agent
+
+DEFAULT_AGENT = "minimax:heuristic=advanced,type=alpha-beta"
+
+# agent of this worker process, built once by start_worker
+worker_agent = None
+
+
+def read_positions(path):
+    """
+    reads positions from a file of one FEN or EPD record per line.
+    :param path: str FEN or EPD file path.
+    :return: generator of tuples (index, id, fen, epd operations), a line
+            that is neither FEN nor EPD comes as (index, None, line,
+            {"error": message}).
+    """
+    with open(path) as file:
+        index = 0
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                board, operations = chess.Board(line), dict()
+            except ValueError:
+                try:
+                    board, operations = chess.Board.from_epd(line)
+                except ValueError as error:
+                    yield (index, None, line, {"error": repr(error)})
+                    index += 1
+                    continue
+            yield (index, operations.get("id"), board.fen(), operations)
+            index += 1
+
+
+def start_worker(agent_spec):
+    """
+    builds the agent of a worker process.
+    :param agent_spec: str agent spec for ai_chess.make_agent.
+    """
+    global worker_agent
+    worker_agent = make_agent(agent_spec)
+
+
+def analyse_position(index, position_id, fen, depth, time_limit, top_k):
+    """
+    analyses one position with the worker's agent by iterative deepening.
+    :param index: int position number.
+    :param position_id: str position id or None.
+    :param fen: str position in FEN standard.
+    :param depth: int search depth in plies.
+    :param time_limit: float seconds per position or None, the search then
+           stops at whichever of depth and time_limit comes first.
+    :param top_k: int moves reported with their scores.
+    :return: dict analysis result.
+    """
+    agent = worker_agent
+    board = chess.Board(fen)
+    result = {"index": index, "id": position_id, "fen": fen, "best": None,
+              "score": None, "top": [], "depth": 0, "nodes": 0, "time": 0.0}
+    start = time.time()
+    if board.is_game_over():
+        return result
+
+    if not hasattr(agent, "set_max_depth"):
+        result["best"] = agent.agent(board)
+        result["score"] = getattr(agent, "best_score", None)
+        result["top"] = [[result["best"], result["score"]]]
+        result["depth"] = 1
+        result["time"] = time.time() - start
+        return result
+
+    max_depth = agent.get_max_depth()
+    agent.nodes = 0
+    if time_limit is not None:
+        agent.stop = lambda: time.time() - start >= time_limit
+    try:
+        for plies in range(1, depth + 1):
+            agent.set_max_depth(plies - 1)
+            best = agent.agent(board.copy())
+            result["best"] = best
+            result["score"] = agent.best_score
+            result["top"] = [list(entry) for entry in (agent.root_moves or [(best, agent.best_score)])[:top_k]]
+            result["depth"] = plies
+            if agent.mate_line is not None or agent.book_move(board) is not None:
+                break
+    except SearchStopped:
+        pass
+    finally:
+        agent.stop = None
+        agent.set_max_depth(max_depth)
+
+    if result["best"] is None:
+        # not even depth 1 finished in time
+        result["best"] = next(iter(board.legal_moves)).uci()
+    result["nodes"] = agent.nodes
+    result["time"] = time.time() - start
+    return result
+
+
+def analyse(positions,
+            agent_spec=DEFAULT_AGENT,
+            depth=2,
+            time_limit=None,
+            top_k=3,
+            workers=None,
+            ordered=True,
+            max_pending=None):
+    """
+    analyses positions across worker processes.
+    :param positions: iterable of tuples (index, id, fen, ...) as produced by
+           read_positions.
+    :param agent_spec: str agent spec for ai_chess.make_agent.
+           default is an alpha-beta agent with the advanced heuristic.
+    :param depth: int search depth in plies.
+           default is 2.
+    :param time_limit: float seconds per position.
+           default is None, no time limit.
+    :param top_k: int moves reported with their scores.
+           default is 3.
+    :param workers: int worker processes.
+           default is None, one per CPU.
+    :param ordered: boolean if results come in input order, otherwise they
+           come as they finish and are matched by index.
+           default is True.
+    :param max_pending: int positions submitted but not yet returned.
+           default is None, 16 per worker.
+    :return: generator of result dicts.
+    """
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 16 * workers
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=start_worker,
+                                                initargs=(agent_spec,)) as pool:
+        pending = dict()
+        finished = dict()
+        next_index = 0
+        positions = iter(positions)
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_pending:
+                position = next(positions, None)
+                if position is None:
+                    exhausted = True
+                    break
+                index, position_id, fen = position[:3]
+                if len(position) > 3 and "error" in position[3]:
+                    finished[index] = {"index": index, "id": position_id, "fen": fen,
+                                       "error": position[3]["error"]}
+                    continue
+                future = pool.submit(analyse_position, index, position_id, fen,
+                                     depth, time_limit, top_k)
+                pending[future] = (index, position_id, fen)
+            if not ordered:
+                for index in list(finished):
+                    yield finished.pop(index)
+            if not pending:
+                while next_index in finished:
+                    yield finished.pop(next_index)
+                    next_index += 1
+                break
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index, position_id, fen = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as error:
+                    result = {"index": index, "id": position_id, "fen": fen, "error": repr(error)}
+                if not ordered:
+                    yield result
+                    continue
+                finished[result["index"]] = result
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="analyse positions from a FEN or EPD file")
+    parser.add_argument("positions", help="file with one FEN or EPD record per line")
+    parser.add_argument("--agent", default=DEFAULT_AGENT, help="agent spec, e.g. " + DEFAULT_AGENT)
+    parser.add_argument("--depth", type=int, default=2, help="search depth in plies")
+    parser.add_argument("--time", type=float, default=None, help="seconds per position")
+    parser.add_argument("--top", type=int, default=3, help="moves reported with scores")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--unordered", action="store_true", help="write results as they finish")
+    parser.add_argument("--out", default=None, help="JSON lines output file, default stdout")
+    args = parser.parse_args()
+
+    out = open(args.out, "w") if args.out else sys.stdout
+    try:
+        for result in analyse(read_positions(args.positions), args.agent, args.depth,
+                              args.time, args.top, args.workers, not args.unordered):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
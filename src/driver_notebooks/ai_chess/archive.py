@@ -0,0 +1,237 @@
+"""
+Compact binary archive of played games.
+
+Layout (little-endian):
+    magic        8 bytes  b"AICGA001"
+    records      one per game: header struct followed by one uint16 per ply
+    strings      utf-8 JSON list of agent names and start FENs
+    index        one uint64 record offset per game
+    footer       uint64 strings offset, uint64 index offset, uint64 game
+                 count, 8 bytes magic
+
+A move is stored as from_square | to_square << 6 | (promotion - 1) << 12,
+so a game costs 14 bytes of header and two bytes per ply.
+"""
+import json
+import mmap
+import struct
+import chess
+import chess.pgn
+
+MAGIC = b"AICGA001"
+
+# white name id, black name id, start fen id, depth, result, plies
+HEADER = struct.Struct("<HHHhBxI")
+FOOTER = struct.Struct("<QQQ8s")
+
+# start fen id of the standard start position, string ids stay below it
+STANDARD_START = 0xFFFF
+NO_DEPTH = -1
+
+RESULTS = ["*", "1-0", "0-1", "1/2-1/2"]
+
+
+def encode_move(move):
+    """
+    packs a move into 16 bits.
+    :param move: python-chess move.
+    :return: int encoded move.
+    """
+    promotion = move.promotion - 1 if move.promotion else 0
+    return move.from_square | move.to_square << 6 | promotion << 12
+
+
+def decode_move(code):
+    """
+    unpacks a 16 bit move.
+    :param code: int encoded move.
+    :return: python-chess move.
+    """
+    from_square = code & 0x3F
+    to_square = (code >> 6) & 0x3F
+    if from_square == to_square:
+        return chess.Move.null()
+    promotion = (code >> 12) & 0x7
+    return chess.Move(from_square, to_square, promotion + 1 if promotion else None)
+
+
+class ArchiveWriter:
+    """
+    Streams games into an archive file.
+
+    Records are written as soon as a game is added, the string table and the
+    offset index are written by close.
+    """
+
+    def __init__(self, path):
+        """
+        archive writer constructor.
+        :param path: str archive file path, overwritten if it exists.
+        """
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.strings = list()
+        self.string_ids = dict()
+        self.offsets = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def string_id(self, value):
+        """
+        interns a string in the archive's string table.
+        :param value: str agent name or FEN.
+        :return: int string id.
+        :raises ValueError: if the table already holds the 65535 strings
+                ids can address.
+        """
+        if value not in self.string_ids:
+            if len(self.strings) >= STANDARD_START:
+                raise ValueError("archive string table is full (%d agent names and start "
+                                 "positions), start a new archive" % STANDARD_START)
+            self.string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return self.string_ids[value]
+
+    def add_game(self, board, white, black, depth=None, result="*"):
+        """
+        appends one game.
+        :param board: python-chess board holding the game's move stack.
+        :param white: str name of the white agent.
+        :param black: str name of the black agent.
+        :param depth: int search depth of the tested agent or None.
+               default is None.
+        :param result: str PGN result "1-0" | "0-1" | "1/2-1/2" | "*".
+               default is "*".
+        """
+        start_fen = board.root().fen()
+        fen_id = STANDARD_START if start_fen == chess.STARTING_FEN else self.string_id(start_fen)
+        white_id = self.string_id(white)
+        black_id = self.string_id(black)
+        moves = [encode_move(move) for move in board.move_stack]
+
+        self.offsets.append(self.file.tell())
+        self.file.write(HEADER.pack(white_id,
+                                    black_id,
+                                    fen_id,
+                                    NO_DEPTH if depth is None else depth,
+                                    RESULTS.index(result),
+                                    len(moves)))
+        self.file.write(struct.pack("<%dH" % len(moves), *moves))
+
+    def close(self):
+        """
+        writes the string table, index and footer and closes the file.
+        """
+        if self.file.closed:
+            return
+        strings_offset = self.file.tell()
+        self.file.write(json.dumps(self.strings).encode("utf-8"))
+        index_offset = self.file.tell()
+        self.file.write(struct.pack("<%dQ" % len(self.offsets), *self.offsets))
+        self.file.write(FOOTER.pack(strings_offset, index_offset, len(self.offsets), MAGIC))
+        self.file.close()
+
+
+class ArchiveReader:
+    """
+    Memory-mapped random access to an archive.
+
+    Move lists are memoryviews into the mapping, nothing is copied until a
+    game is replayed.
+    """
+
+    def __init__(self, path):
+        """
+        archive reader constructor.
+        :param path: str archive file path.
+        """
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if bytes(self.view[:len(MAGIC)]) != MAGIC:
+            raise ValueError("not a game archive: " + path)
+        strings_offset, index_offset, count, magic = FOOTER.unpack_from(self.map, len(self.map) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError("archive was not closed: " + path)
+        self.strings = json.loads(bytes(self.view[strings_offset:index_offset]).decode("utf-8"))
+        self.index = self.view[index_offset:index_offset + 8 * count].cast("Q")
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.header(i)
+
+    def close(self):
+        """
+        releases the memory mapping.
+        """
+        self.index.release()
+        self.view.release()
+        self.map.close()
+
+    def header(self, i):
+        """
+        header of a game.
+        :param i: int game number.
+        :return: dict with white, black, fen, depth, result and plies.
+        """
+        white, black, fen_id, depth, result, plies = HEADER.unpack_from(self.map, self.index[i])
+        return {"white": self.strings[white],
+                "black": self.strings[black],
+                "fen": chess.STARTING_FEN if fen_id == STANDARD_START else self.strings[fen_id],
+                "depth": None if depth == NO_DEPTH else depth,
+                "result": RESULTS[result],
+                "plies": plies}
+
+    def move_codes(self, i):
+        """
+        encoded moves of a game without copying them.
+        :param i: int game number.
+        :return: memoryview of uint16 move codes.
+        """
+        offset = self.index[i]
+        plies = HEADER.unpack_from(self.map, offset)[5]
+        start = offset + HEADER.size
+        return self.view[start:start + 2 * plies].cast("H")
+
+    def board(self, i):
+        """
+        replays a game.
+        :param i: int game number.
+        :return: python-chess board after the last move, with its move stack.
+        """
+        board = chess.Board(self.header(i)["fen"])
+        for code in self.move_codes(i):
+            board.push(decode_move(code))
+        return board
+
+    def pgn(self, i):
+        """
+        a game as PGN.
+        :param i: int game number.
+        :return: chess.pgn.Game.
+        """
+        header = self.header(i)
+        game = chess.pgn.Game.from_board(self.board(i))
+        game.headers["White"] = header["white"]
+        game.headers["Black"] = header["black"]
+        game.headers["Result"] = header["result"]
+        game.headers["Round"] = str(i + 1)
+        if header["depth"] is not None:
+            game.headers["Depth"] = str(header["depth"])
+        return game
+
+    def export_pgn(self, path):
+        """
+        writes every game of the archive to a PGN file.
+        :param path: str PGN file path.
+        """
+        with open(path, "w") as file:
+            for i in range(len(self)):
+                print(self.pgn(i), file=file, end="\n\n")
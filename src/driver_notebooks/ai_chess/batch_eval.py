@@ -0,0 +1,62 @@
+"""
+Vectorized material and piece-square table scoring of many positions.
+
+The boards are stacked into a (positions, 768) 0/1 matrix, one column per
+piece and square (white pieces first, black after), and scored by a single
+matrix product with a weight vector holding value + table weight for white
+and the negated mirrored weights for black. The result is the same white
+point of view score advanced_evaluation computes for ordinary positions.
+
+Imported lazily by MiniMaxAgent so numpy is only loaded when batching is on.
+"""
+import chess
+import numpy as np
+
+import ai_chess
+
+weights = None
+
+
+def build_weights():
+    """
+    rebuilds the weight vector from the current piece values and tables,
+    called at import and by ai_chess.build_eval_layers.
+    """
+    global weights
+    vector = np.zeros(2 * 6 * 64, dtype=np.int64)
+    for piece_type, table in ai_chess.piece_tables.items():
+        value = ai_chess.piece_values[piece_type]
+        start = (piece_type - 1) * 64
+        vector[start:start + 64] = value + np.array(table)
+        mirrored = [table[chess.square_mirror(square)] for square in chess.SQUARES]
+        vector[384 + start:384 + start + 64] = -(value + np.array(mirrored))
+    weights = vector
+
+
+def piece_bitboards(boards):
+    """
+    stacked piece bitboards of positions.
+    :param boards: list of python-chess boards.
+    :return: uint64 array (positions, 12).
+    """
+    rows = list()
+    for board in boards:
+        white, black = board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK]
+        rows.append((board.pawns & white, board.knights & white, board.bishops & white,
+                     board.rooks & white, board.queens & white, board.kings & white,
+                     board.pawns & black, board.knights & black, board.bishops & black,
+                     board.rooks & black, board.queens & black, board.kings & black))
+    return np.array(rows, dtype="<u8").reshape(len(boards), 12)
+
+
+def batch_score(boards):
+    """
+    material and piece-square table scores from white's point of view.
+    :param boards: list of python-chess boards.
+    :return: int64 array of scores.
+    """
+    bits = np.unpackbits(piece_bitboards(boards).view(np.uint8), axis=1, bitorder="little")
+    return bits @ weights
+
+
+build_weights()
@@ -0,0 +1,254 @@
+"""
+Micro benchmarks for the search components.
+
+Run with `python -m ai_chess.bench` from the driver_notebooks directory.
+"""
+import time
+import chess
+
+from ai_chess import Clock, MCTSAgent, MiniMaxAgent, StagedMoveGenerator, bitboard_score, mate
+
+# middlegame positions with obvious captures, where the first moves searched
+# usually produce a cutoff
+CUTOFF_POSITIONS = [
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4",
+    "r2q1rk1/ppp2ppp/2np1n2/2b1p1B1/2B1P1b1/2NP1N2/PPP2PPP/R2Q1RK1 w - - 0 8",
+    "r1b1kbnr/pppp1ppp/2n5/4p1q1/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+]
+
+# forced mates by checks, with the number of moves to mate
+MATE_PUZZLES = [
+    ("r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4", 1),
+    ("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", 1),
+    ("6rk/6pp/8/6N1/8/8/8/6QK w - - 0 1", 1),
+    ("1k6/ppp5/8/8/8/8/5PPP/2R1R1K1 w - - 0 1", 1),
+    ("r2qkb1r/pp2nppp/3p4/2pNN1B1/2BnP3/3P4/PPP2PPP/R2bK2R w KQkq - 1 10", 2),
+    ("6k1/pp4p1/2p5/2bp4/8/P5Pb/1P3rrP/2BRRN1K b - - 0 1", 2),
+    ("r1b1kb1r/pppp1ppp/5q2/4n3/3KP3/2N3PN/PPP4P/R1BQ1B1R b kq - 0 1", 3),
+    ("r5rk/5p1p/5R2/4B3/8/8/7P/7K w - - 0 1", 3),
+    ("2r3k1/p4p2/3Rp2p/1p2P1pK/8/1P4P1/P3Q2P/1q6 b - - 0 1", 3),
+    ("r1bk3r/pppq1ppp/5n2/4N1N1/2Bp4/Bn6/P4PPP/4R1K1 w - - 0 1", 4),
+]
+
+
+def movegen_benchmark(fens=CUTOFF_POSITIONS, repeat=2000):
+    """
+    times producing the first move of a node with the full legal move list
+    against the staged move generator.
+    :param fens: list of str positions in FEN standard.
+    :param repeat: int number of timed repetitions per position.
+    :return: list of tuples (fen, legal_list_seconds, staged_seconds).
+    """
+    results = list()
+    for fen in fens:
+        board = chess.Board(fen)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            moves = list(board.legal_moves)
+            moves[0]
+        eager = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            next(iter(StagedMoveGenerator(board)))
+        staged = time.perf_counter() - start
+
+        results.append((fen, eager, staged))
+    return results
+
+
+def search_benchmark(fens=CUTOFF_POSITIONS, depth=2, heuristic="advanced"):
+    """
+    times a full alpha-beta move choice with and without staged move
+    generation, checking both pick the same move with the same score.
+    :param fens: list of str positions in FEN standard.
+    :param depth: int maximum state search depth.
+    :param heuristic: str evaluation heuristic of the agent.
+    :return: list of tuples (fen and node counts, legal_list_seconds,
+            staged_seconds).
+    """
+    results = list()
+    for fen in fens:
+        timings = list()
+        choices = list()
+        nodes = list()
+        for staged in (False, True):
+            agent = MiniMaxAgent(max_depth=depth,
+                                 heuristic=heuristic,
+                                 type="alpha-beta",
+                                 staged_movegen=staged)
+            start = time.perf_counter()
+            choices.append((agent.agent(chess.Board(fen)), agent.best_score))
+            timings.append(time.perf_counter() - start)
+            nodes.append(agent.nodes)
+        assert choices[0] == choices[1]
+        label = "%s  nodes %d -> %d" % (fen[:40], nodes[0], nodes[1])
+        results.append((label, timings[0], timings[1]))
+    return results
+
+
+def eval_benchmark(fens=CUTOFF_POSITIONS, repeat=5000):
+    """
+    times the advanced evaluation against the bitboard evaluation kernel on
+    the same leaves and checks that both return the same score.
+    :param fens: list of str positions in FEN standard.
+    :param repeat: int number of timed evaluations per position.
+    :return: list of tuples (fen, advanced_seconds, bitboard_seconds).
+    """
+    agent = MiniMaxAgent(heuristic="advanced")
+    results = list()
+    for fen in fens:
+        board = chess.Board(fen)
+        assert agent.advanced_evaluation(board) == agent.bitboard_evaluation(board)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            agent.advanced_evaluation(board)
+        advanced = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            agent.bitboard_evaluation(board)
+        bitboard = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            bitboard_score(board)
+        kernel = time.perf_counter() - start
+
+        results.append((fen, advanced, bitboard))
+        results.append(("  bitboard_score kernel alone", advanced, kernel))
+    return results
+
+
+def batch_benchmark(fens=CUTOFF_POSITIONS, depth=1, heuristic="advanced", batch_threshold=8):
+    """
+    times a minimax move choice with leaves evaluated one at a time against
+    batched leaf evaluation, checking both pick the same move with the same
+    score after visiting the same number of nodes.
+    :param fens: list of str positions in FEN standard.
+    :param depth: int maximum state search depth.
+    :param heuristic: str evaluation heuristic of the agent.
+    :param batch_threshold: int smallest batched node.
+    :return: list of tuples (fen, scalar_seconds, batched_seconds).
+    """
+    results = list()
+    for fen in fens:
+        timings = list()
+        choices = list()
+        for threshold in (None, batch_threshold):
+            agent = MiniMaxAgent(max_depth=depth,
+                                 heuristic=heuristic,
+                                 type="minimax",
+                                 batch_threshold=threshold)
+            start = time.perf_counter()
+            choices.append((agent.agent(chess.Board(fen)), agent.best_score, agent.nodes))
+            timings.append(time.perf_counter() - start)
+        assert choices[0] == choices[1]
+        results.append((fen, timings[0], timings[1]))
+    return results
+
+
+def cache_benchmark(fens=CUTOFF_POSITIONS, depth=2, heuristic="advanced"):
+    """
+    times an alpha-beta move choice without and with the evaluation and pawn
+    hash tables, checking both pick the same move.
+    :param fens: list of str positions in FEN standard.
+    :param depth: int maximum state search depth.
+    :param heuristic: str evaluation heuristic of the agent.
+    :return: list of tuples (fen and hit rates, uncached_seconds, cached_seconds).
+    """
+    results = list()
+    for fen in fens:
+        timings = list()
+        choices = list()
+        for eval_cache_size, pawn_cache_size in ((0, 0), (65536, 16384)):
+            agent = MiniMaxAgent(max_depth=depth,
+                                 heuristic=heuristic,
+                                 type="alpha-beta",
+                                 eval_cache_size=eval_cache_size,
+                                 pawn_cache_size=pawn_cache_size)
+            start = time.perf_counter()
+            choices.append((agent.agent(chess.Board(fen)), agent.best_score))
+            timings.append(time.perf_counter() - start)
+        assert choices[0] == choices[1]
+        label = "%s  eval %.0f%% pawn %.0f%%" % (fen[:40], 100 * agent.eval_cache.hit_rate(),
+                                                 100 * agent.pawn_cache.hit_rate())
+        results.append((label, timings[0], timings[1]))
+    return results
+
+
+def mate_benchmark(puzzles=MATE_PUZZLES, max_moves=4, max_nodes=20000):
+    """
+    times the proof-number mate solver on mate puzzles.
+    :param puzzles: list of tuples (fen, moves to mate).
+    :param max_moves: int longest mate searched for.
+    :param max_nodes: int node budget per puzzle.
+    :return: list of tuples (fen, moves to mate, moves found or None, seconds).
+    """
+    results = list()
+    for fen, moves in puzzles:
+        start = time.perf_counter()
+        found = mate.solve(chess.Board(fen), max_moves, max_nodes)
+        elapsed = time.perf_counter() - start
+        results.append((fen, moves, None if found is None else (found[1] + 1) // 2, elapsed))
+    return results
+
+
+def mcts_budget_benchmark(fens=CUTOFF_POSITIONS):
+    """
+    times MCTS move choices with no budget left, zero iterations, a zero time
+    limit and an empty clock, checking a legal move is still played.
+    :param fens: list of str positions in FEN standard.
+    :return: list of tuples (fen, zero_iterations_seconds, empty_clock_seconds).
+    """
+    results = list()
+    for fen in fens:
+        board = chess.Board(fen)
+        timings = list()
+        for agent, clock in ((MCTSAgent(iterations=0), None),
+                             (MCTSAgent(time_limit=0), None),
+                             (MCTSAgent(), Clock(0))):
+            start = time.perf_counter()
+            move = agent.choice(board, clock)
+            timings.append(time.perf_counter() - start)
+            assert chess.Move.from_uci(move) in board.legal_moves
+        results.append((fen, timings[0], timings[2]))
+    return results
+
+
+def report_mates(title, results):
+    """
+    prints mate puzzle results with the solve rate.
+    :param title: str benchmark name.
+    :param results: list of tuples (fen, moves to mate, moves found, seconds).
+    """
+    print(title)
+    for fen, moves, found, elapsed in results:
+        print("%-72s mate %d found %-4s %9.4fs" % (fen, moves, found, elapsed))
+    solved = [elapsed for _, moves, found, elapsed in results if found == moves]
+    print("solved %d/%d, %.4fs mean time to solve" % (len(solved), len(results),
+                                                     sum(solved) / max(len(solved), 1)))
+
+
+def report(title, results):
+    """
+    prints benchmark timings as a table.
+    :param title: str benchmark name.
+    :param results: list of tuples (fen, baseline_seconds, candidate_seconds).
+    """
+    print(title)
+    for fen, baseline, candidate in results:
+        print("%-72s %9.4fs %9.4fs  x%.2f" % (fen, baseline, candidate, baseline / candidate))
+
+
+if __name__ == "__main__":
+    report("movegen to first move (legal list vs staged)", movegen_benchmark())
+    report("alpha-beta depth 2 choice (legal list vs staged)", search_benchmark())
+    report("leaf evaluation (advanced vs bitboard)", eval_benchmark())
+    report("minimax depth 1 choice (scalar vs batched leaves)", batch_benchmark())
+    report("alpha-beta depth 2 choice (no caches vs eval and pawn hash)", cache_benchmark())
+    report_mates("proof-number mate solver", mate_benchmark())
+    report("mcts choice without budget (zero iterations vs empty clock)", mcts_budget_benchmark())
@@ -0,0 +1,333 @@
+"""
+Endgame bitbases for king and pawn, rook or queen against king.
+
+A bitbase holds one bit per position, set when the side with the extra piece
+(the strong side) wins with best play and clear for a draw or an illegal
+position, the lone king can never win. Positions are indexed with the strong
+side as white:
+    KRK, KQK    ((side * 10 + strong king) * 64 + weak king) * 64 + piece,
+                the board turned so the strong king is in the a1-d1-d4
+                triangle
+    KPK         ((side * 24 + pawn) * 64 + strong king) * 64 + weak king,
+                the board mirrored so the pawn is on files a to d
+where side is 0 with the strong side to move and 1 with the lone king to
+move. That is 10 KB for KRK and KQK and 24 KB for KPK.
+
+The tables are generated by retrograde analysis the first time they are
+probed, which takes a few seconds, and kept in CACHE_DIR for later runs.
+Run `python -m ai_chess.bitbase` from the driver_notebooks directory to
+generate them ahead of time. Castling rights, en passant and the fifty move
+rule are not taken into account.
+"""
+import argparse
+import os
+import time
+import chess
+
+ENDINGS = {"kpk": chess.PAWN, "krk": chess.ROOK, "kqk": chess.QUEEN}
+
+# directory generated bitbases are saved to and read from
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ai_chess")
+
+# bitbases already loaded in this process, by ending name
+loaded = dict()
+
+# retrograde analysis states of a position
+UNKNOWN = 0
+WIN = 1
+DRAW = 2
+ILLEGAL = 3
+
+# a1-d1-d4 triangle the strong king is moved into when there is no pawn
+TRIANGLE = [square for square in chess.SQUARES
+            if chess.square_file(square) <= 3 and chess.square_rank(square) <= chess.square_file(square)]
+TRIANGLE_INDEX = {square: i for i, square in enumerate(TRIANGLE)}
+
+
+def transform(king):
+    """
+    square mapping that turns the board so a king lands in the triangle.
+    :param king: int square of the king.
+    :return: list of 64 int squares, the image of every square.
+    """
+    mapping = list()
+    for square in chess.SQUARES:
+        if chess.square_file(king) > 3:
+            square ^= 7
+        if chess.square_rank(king) > 3:
+            square ^= 56
+        mapping.append(square)
+    king = mapping[king]
+    if chess.square_rank(king) > chess.square_file(king):
+        mapping = [chess.square(chess.square_rank(square), chess.square_file(square))
+                   for square in mapping]
+    return mapping
+
+TRANSFORMS = [transform(square) for square in chess.SQUARES]
+
+
+def table_size(piece_type):
+    """
+    number of positions of a bitbase.
+    :param piece_type: int python-chess piece type of the strong side.
+    :return: int positions.
+    """
+    return 2 * (24 if piece_type == chess.PAWN else len(TRIANGLE)) * 64 * 64
+
+
+def position_index(piece_type, side, strong_king, weak_king, piece):
+    """
+    index of a position in its bitbase, with the strong side as white.
+    :param piece_type: int python-chess piece type of the strong side.
+    :param side: int 0 with the strong side to move, 1 with the lone king.
+    :param strong_king: int square.
+    :param weak_king: int square.
+    :param piece: int square of the pawn, rook or queen.
+    :return: int index.
+    """
+    if piece_type == chess.PAWN:
+        if piece & 7 > 3:
+            strong_king, weak_king, piece = strong_king ^ 7, weak_king ^ 7, piece ^ 7
+        pawn = ((piece >> 3) - 1) * 4 + (piece & 7)
+        return ((side * 24 + pawn) * 64 + strong_king) * 64 + weak_king
+    mapping = TRANSFORMS[strong_king]
+    return ((side * len(TRIANGLE) + TRIANGLE_INDEX[mapping[strong_king]]) * 64 +
+            mapping[weak_king]) * 64 + mapping[piece]
+
+
+def positions(piece_type):
+    """
+    positions of a bitbase in index order.
+    :param piece_type: int python-chess piece type of the strong side.
+    :return: generator of tuples (side, strong king, weak king, piece).
+    """
+    for side in (0, 1):
+        if piece_type == chess.PAWN:
+            for rank in range(1, 7):
+                for file in range(4):
+                    for strong_king in chess.SQUARES:
+                        for weak_king in chess.SQUARES:
+                            yield (side, strong_king, weak_king, chess.square(file, rank))
+        else:
+            for strong_king in TRIANGLE:
+                for weak_king in chess.SQUARES:
+                    for piece in chess.SQUARES:
+                        yield (side, strong_king, weak_king, piece)
+
+
+def attacks(piece_type, square, occupied):
+    """
+    squares attacked by the strong side's pawn, rook or queen.
+    :param piece_type: int python-chess piece type.
+    :param square: int square of the piece.
+    :param occupied: int bitboard of occupied squares.
+    :return: int bitboard.
+    """
+    if piece_type == chess.PAWN:
+        return chess.BB_PAWN_ATTACKS[chess.WHITE][square]
+    found = chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] | \
+        chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied]
+    if piece_type == chess.QUEEN:
+        found |= chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+    return found
+
+
+def expand(piece_type, side, strong_king, weak_king, piece, promotions):
+    """
+    moves of a position, or its value when it is decided without looking
+    further.
+    :param piece_type: int python-chess piece type of the strong side.
+    :param side: int 0 with the strong side to move, 1 with the lone king.
+    :param strong_king: int square.
+    :param weak_king: int square.
+    :param piece: int square of the pawn, rook or queen.
+    :param promotions: list of tuples (bitbase, piece type) pawns promote to.
+    :return: tuple (state, indices) of the state, UNKNOWN unless decided, and
+            the bitbase indices reached by the moves.
+    """
+    strong_bb = chess.BB_SQUARES[strong_king]
+    weak_bb = chess.BB_SQUARES[weak_king]
+    piece_bb = chess.BB_SQUARES[piece]
+    if strong_king == weak_king or piece_bb & (strong_bb | weak_bb) or \
+            chess.BB_KING_ATTACKS[strong_king] & weak_bb:
+        return (ILLEGAL, None)
+    occupied = strong_bb | weak_bb | piece_bb
+
+    moves = list()
+    if side == 1:
+        guarded = chess.BB_KING_ATTACKS[strong_king] | attacks(piece_type, piece, occupied & ~weak_bb)
+        for to in chess.scan_forward(chess.BB_KING_ATTACKS[weak_king] & ~guarded):
+            if to == piece:
+                # the piece is lost for good
+                return (DRAW, None)
+            moves.append(position_index(piece_type, 0, strong_king, to, piece))
+        if not moves:
+            return (WIN if attacks(piece_type, piece, occupied) & weak_bb else DRAW, None)
+        return (UNKNOWN, moves)
+
+    if attacks(piece_type, piece, occupied) & weak_bb:
+        # the lone king is in check with the strong side to move
+        return (ILLEGAL, None)
+    for to in chess.scan_forward(chess.BB_KING_ATTACKS[strong_king] &
+                                 ~chess.BB_KING_ATTACKS[weak_king] & ~piece_bb):
+        moves.append(position_index(piece_type, 1, to, weak_king, piece))
+    if piece_type == chess.PAWN:
+        to = piece + 8
+        if not occupied & chess.BB_SQUARES[to]:
+            if to >= chess.A8:
+                for bits, promotion in promotions:
+                    if probe_bits(bits, position_index(promotion, 1, strong_king, weak_king, to)):
+                        return (WIN, None)
+            else:
+                moves.append(position_index(piece_type, 1, strong_king, weak_king, to))
+                if piece < chess.A3 and not occupied & chess.BB_SQUARES[to + 8]:
+                    moves.append(position_index(piece_type, 1, strong_king, weak_king, to + 8))
+    else:
+        for to in chess.scan_forward(attacks(piece_type, piece, occupied) & ~occupied):
+            moves.append(position_index(piece_type, 1, strong_king, weak_king, to))
+    if not moves:
+        # stalemate, or only promotions that do not win
+        return (DRAW, None)
+    return (UNKNOWN, moves)
+
+
+def generate(piece_type):
+    """
+    builds a bitbase by retrograde analysis. Decided positions are
+    propagated back to the positions leading to them: a position with the
+    strong side to move is won by one won move and drawn once every move
+    draws, a position with the lone king to move is drawn by one drawing move
+    and lost once every move loses. Positions left undecided can not be
+    forced to a win and are draws.
+    :param piece_type: int python-chess piece type of the strong side.
+    :return: bytearray bitbase.
+    """
+    size = table_size(piece_type)
+    promotions = [(load("kqk"), chess.QUEEN), (load("krk"), chess.ROOK)] \
+        if piece_type == chess.PAWN else None
+    state = bytearray(size)
+    remaining = [0] * size
+    parents = [None] * size
+    queue = list()
+    for index, position in enumerate(positions(piece_type)):
+        value, moves = expand(piece_type, *position, promotions)
+        if value != UNKNOWN:
+            state[index] = value
+            if value != ILLEGAL:
+                queue.append(index)
+            continue
+        remaining[index] = len(moves)
+        for move in moves:
+            if parents[move] is None:
+                parents[move] = [index]
+            else:
+                parents[move].append(index)
+
+    # the strong side to move comes first in every table
+    half = size // 2
+    while queue:
+        index = queue.pop()
+        value = state[index]
+        for parent in parents[index] or ():
+            if state[parent] != UNKNOWN:
+                continue
+            if (value == WIN) == (parent < half):
+                state[parent] = value
+                queue.append(parent)
+            else:
+                remaining[parent] -= 1
+                if remaining[parent] == 0:
+                    state[parent] = value
+                    queue.append(parent)
+
+    bits = bytearray((size + 7) // 8)
+    for index in range(size):
+        if state[index] == WIN:
+            bits[index >> 3] |= 1 << (index & 7)
+    return bits
+
+
+def probe_bits(bits, index):
+    """
+    reads one position of a bitbase.
+    :param bits: bytes bitbase.
+    :param index: int position index.
+    :return: int 1 if the strong side wins, 0 otherwise.
+    """
+    return bits[index >> 3] >> (index & 7) & 1
+
+
+def load(name):
+    """
+    bitbase of an ending, read from CACHE_DIR or generated and saved there
+    on first use. Each ending is loaded once per process.
+    :param name: str "kpk", "krk" or "kqk".
+    :return: bytes bitbase.
+    """
+    if name not in loaded:
+        path = os.path.join(CACHE_DIR, name + ".bitbase")
+        size = (table_size(ENDINGS[name]) + 7) // 8
+        bits = None
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                bits = file.read()
+            if len(bits) != size:
+                bits = None
+        if bits is None:
+            bits = bytes(generate(ENDINGS[name]))
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                # written aside and renamed so parallel workers never read a
+                # partial file
+                temporary = "%s.%d" % (path, os.getpid())
+                with open(temporary, "wb") as file:
+                    file.write(bits)
+                os.replace(temporary, path)
+            except OSError:
+                # the table is regenerated by the next process instead
+                pass
+        loaded[name] = bits
+    return loaded[name]
+
+
+def probe(board):
+    """
+    win/draw/loss of a king and pawn, rook or queen against king position.
+    :param board: a python-chess board.
+    :return: int wdl for the side to move, 2 for a win, 0 for a draw and -2
+            for a loss as in syzygy tablebases, or None if the position is not
+            covered.
+    """
+    if chess.popcount(board.occupied) != 3 or board.castling_rights:
+        return None
+    strong = chess.WHITE if chess.popcount(board.occupied_co[chess.WHITE]) == 2 else chess.BLACK
+    piece = chess.lsb(board.occupied_co[strong] & ~board.kings)
+    piece_type = board.piece_type_at(piece)
+    if piece_type not in (chess.PAWN, chess.ROOK, chess.QUEEN):
+        return None
+    strong_king, weak_king = board.king(strong), board.king(not strong)
+    if strong == chess.BLACK:
+        strong_king, weak_king, piece = strong_king ^ 56, weak_king ^ 56, piece ^ 56
+    side = 0 if board.turn == strong else 1
+    bits = load({chess.PAWN: "kpk", chess.ROOK: "krk", chess.QUEEN: "kqk"}[piece_type])
+    if not probe_bits(bits, position_index(piece_type, side, strong_king, weak_king, piece)):
+        return 0
+    return 2 if side == 0 else -2
+
+
+def main():
+    global CACHE_DIR
+    parser = argparse.ArgumentParser(description="generate the KPK, KRK and KQK bitbases")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="directory the bitbases are saved to")
+    args = parser.parse_args()
+
+    CACHE_DIR = args.cache_dir
+    for name in ("kqk", "krk", "kpk"):
+        start = time.time()
+        bits = load(name)
+        wins = sum(bin(byte).count("1") for byte in bits)
+        print("%s %6d bytes %7d won positions %.1fs" % (name, len(bits), wins, time.time() - start))
+
+
+if __name__ == "__main__":
+    main()
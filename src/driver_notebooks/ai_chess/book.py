@@ -0,0 +1,199 @@
+"""
+Polyglot opening books.
+
+A Polyglot `.bin` file is a key-sorted list of 16 byte big-endian entries:
+    key      uint64 chess.polyglot.zobrist_hash of the position
+    move     uint16 to_square | from_square << 6 | promotion << 12, promotion
+             1 = knight .. 4 = queen, castling written as king takes rook
+    weight   uint16 relative frequency of the move
+    learn    uint32 unused here
+
+OpeningBook loads a book once into a key-sorted numpy array and finds the
+entries of a position with two binary searches. Books can also be built from
+ai_chess.archive files with `python -m ai_chess.book --help` from the
+driver_notebooks directory.
+
+Imported lazily by MiniMaxAgent so numpy is only loaded when a book is used.
+"""
+import argparse
+import random
+import chess
+import chess.polyglot
+import numpy as np
+
+from ai_chess import archive
+
+ENTRY_DTYPE = np.dtype([("key", ">u8"), ("move", ">u2"), ("weight", ">u2"), ("learn", ">u4")])
+
+# books already loaded, shared by every agent using the same file
+loaded_books = dict()
+
+
+def decode_move(board, code):
+    """
+    turns a Polyglot move into a legal move of the position.
+    :param board: a python-chess board.
+    :param code: int Polyglot move.
+    :return: python-chess move or None if the move is not legal.
+    """
+    to_square = code & 0x3F
+    from_square = (code >> 6) & 0x3F
+    promotion = (code >> 12) & 0x7
+    move = chess.Move(from_square, to_square, promotion + 1 if promotion else None)
+    if board.piece_type_at(from_square) == chess.KING and board.color_at(to_square) == board.turn:
+        # king takes own rook is castling
+        file = chess.FILE_NAMES.index("g") if to_square > from_square else chess.FILE_NAMES.index("c")
+        move = chess.Move(from_square, chess.square(file, chess.square_rank(from_square)))
+    return move if board.is_legal(move) else None
+
+
+def encode_move(board, move):
+    """
+    packs a move into the Polyglot 16 bit format.
+    :param board: a python-chess board the move is played in.
+    :param move: python-chess move.
+    :return: int Polyglot move.
+    """
+    to_square = move.to_square
+    if board.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        to_square = chess.square(7 if board.is_kingside_castling(move) else 0, rank)
+    promotion = move.promotion - 1 if move.promotion else 0
+    return to_square | move.from_square << 6 | promotion << 12
+
+
+class OpeningBook:
+    """
+    In-memory Polyglot book.
+    """
+
+    def __init__(self, entries):
+        """
+        opening book constructor.
+        :param entries: numpy array of ENTRY_DTYPE records, sorted here by key.
+        """
+        entries = entries[entries["weight"] > 0]
+        order = np.argsort(entries["key"], kind="stable")
+        self.keys = entries["key"][order].astype(np.uint64)
+        self.moves = entries["move"][order].astype(np.uint16)
+        self.weights = entries["weight"][order].astype(np.uint16)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def entries(self, board):
+        """
+        book moves of a position.
+        :param board: a python-chess board.
+        :return: list of tuples (move, weight) of legal book moves.
+        """
+        key = np.uint64(chess.polyglot.zobrist_hash(board))
+        start = np.searchsorted(self.keys, key, side="left")
+        end = np.searchsorted(self.keys, key, side="right")
+        found = list()
+        for code, weight in zip(self.moves[start:end].tolist(), self.weights[start:end].tolist()):
+            move = decode_move(board, code)
+            if move is not None:
+                found.append((move, weight))
+        return found
+
+    def choose(self, board, selection="weighted", max_plies=None):
+        """
+        picks a book move.
+        :param board: a python-chess board.
+        :param selection: str "weighted" picks at random in proportion to the
+               weights, "best" the highest weight.
+               default is "weighted".
+        :param max_plies: int plies from the start of the game after which the
+               book is no longer used.
+               default is None, no limit.
+        :return: str representation of Universal Chess Interface (UCI) move or
+                None if the position is not in the book.
+        """
+        if max_plies is not None and board.ply() >= max_plies:
+            return None
+        found = self.entries(board)
+        if not found:
+            return None
+        if selection == "best":
+            return max(found, key=lambda entry: entry[1])[0].uci()
+        moves, weights = zip(*found)
+        return random.choices(moves, weights=weights)[0].uci()
+
+
+def load_book(path):
+    """
+    reads a Polyglot book, each file is only read once per process.
+    :param path: str book file path.
+    :return: OpeningBook.
+    """
+    if path not in loaded_books:
+        loaded_books[path] = OpeningBook(np.fromfile(path, dtype=ENTRY_DTYPE))
+    return loaded_books[path]
+
+
+def write_book(path, weights):
+    """
+    writes a Polyglot book.
+    :param path: str book file path.
+    :param weights: dict mapping (key, Polyglot move) to int weight.
+    """
+    entries = np.zeros(len(weights), dtype=ENTRY_DTYPE)
+    for i, ((key, code), weight) in enumerate(sorted(weights.items())):
+        entries[i] = (key, code, weight, 0)
+    entries.tofile(path)
+
+
+def build_weights(archive_paths, max_plies=16, min_games=2):
+    """
+    counts the opening moves of archived games, a win counts 2, a draw 1
+    and a loss 0 for the side that played the move.
+    :param archive_paths: list of str ai_chess.archive file paths.
+    :param max_plies: int plies of every game taken into the book.
+           default is 16.
+    :param min_games: int games a move must have been played in.
+           default is 2.
+    :return: dict mapping (key, Polyglot move) to int weight, scaled into
+            the 16 bit range.
+    """
+    points = {"1-0": {chess.WHITE: 2, chess.BLACK: 0},
+              "0-1": {chess.WHITE: 0, chess.BLACK: 2},
+              "1/2-1/2": {chess.WHITE: 1, chess.BLACK: 1}}
+    weights = dict()
+    games = dict()
+    for path in archive_paths:
+        reader = archive.ArchiveReader(path)
+        for i, header in enumerate(reader):
+            if header["result"] not in points:
+                continue
+            board = chess.Board(header["fen"])
+            for code in reader.move_codes(i)[:max_plies]:
+                move = archive.decode_move(code)
+                entry = (chess.polyglot.zobrist_hash(board), encode_move(board, move))
+                weights[entry] = weights.get(entry, 0) + points[header["result"]][board.turn]
+                games[entry] = games.get(entry, 0) + 1
+                board.push(move)
+        reader.close()
+
+    weights = {entry: weight for entry, weight in weights.items()
+               if weight > 0 and games[entry] >= min_games}
+    largest = max(weights.values(), default=0)
+    if largest > 0xFFFF:
+        weights = {entry: max(1, weight * 0xFFFF // largest) for entry, weight in weights.items()}
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description="build a Polyglot opening book from game archives")
+    parser.add_argument("out", help="book file to write")
+    parser.add_argument("archives", nargs="+", help="ai_chess.archive files")
+    parser.add_argument("--max-plies", type=int, default=16)
+    parser.add_argument("--min-games", type=int, default=2)
+    args = parser.parse_args()
+    weights = build_weights(args.archives, args.max_plies, args.min_games)
+    write_book(args.out, weights)
+    print("%d book entries in %d positions" % (len(weights), len({key for key, _ in weights})))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Self-play position and label generation.
+
+Agents play each other in worker processes, positions are sampled from the
+games and written to chunked `.npy` shards (readable with
+`numpy.load(path, mmap_mode="r")`) next to a `manifest.json`.
+
+Each position is a record of POSITION_DTYPE:
+    planes    12 x 8 uint8, one little-endian 64 bit bitboard per piece
+              (white pawn, knight, bishop, rook, queen, king, then black);
+              `numpy.unpackbits(planes, axis=-1, bitorder="little")` gives
+              12 x 64 bitplanes indexed by square
+    features  uint8 side to move (1 = white), then white kingside, white
+              queenside, black kingside, black queenside castling rights
+    score     float32 search score of the mover's agent from white's point of
+              view, NaN for agents that do not score moves
+    result    int8 final game result from white's point of view (1, 0, -1)
+
+Run with `python -m ai_chess.datagen --help` from the driver_notebooks
+directory.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import random
+import chess
+import numpy as np
+
+from ai_chess import make_agent
+
+POSITION_DTYPE = np.dtype([("planes", np.uint8, (12, 8)),
+                           ("features", np.uint8, (5,)),
+                           ("score", np.float32),
+                           ("result", np.int8)])
+
+RESULTS = {"1-0": 1, "0-1": -1, "1/2-1/2": 0, "*": 0}
+
+
+def encode_position(board):
+    """
+    bitplanes and side to move/castling features of a position.
+    :param board: a python-chess board.
+    :return: tuple (planes, features) of uint8 arrays.
+    """
+    bitboards = [board.pieces_mask(piece_type, color)
+                 for color in (chess.WHITE, chess.BLACK)
+                 for piece_type in chess.PIECE_TYPES]
+    planes = np.array(bitboards, dtype="<u8").view(np.uint8).reshape(12, 8)
+    features = np.array([board.turn == chess.WHITE,
+                         board.has_kingside_castling_rights(chess.WHITE),
+                         board.has_queenside_castling_rights(chess.WHITE),
+                         board.has_kingside_castling_rights(chess.BLACK),
+                         board.has_queenside_castling_rights(chess.BLACK)],
+                        dtype=np.uint8)
+    return (planes, features)
+
+
+def play_selfplay_game(white_spec, black_spec, sample_rate, skip_plies, max_plies, seed):
+    """
+    plays one game and samples labelled positions from it.
+    :param white_spec: str agent spec of the white player.
+    :param black_spec: str agent spec of the black player.
+    :param sample_rate: float probability a position is kept.
+    :param skip_plies: int opening plies never sampled.
+    :param max_plies: int plies after which the game is stopped as a draw.
+    :param seed: int random seed of the game.
+    :return: numpy array of POSITION_DTYPE records.
+    """
+    random.seed(seed)
+    agents = {chess.WHITE: make_agent(white_spec), chess.BLACK: make_agent(black_spec)}
+    board = chess.Board()
+    samples = list()
+
+    while not board.is_game_over(claim_draw=True) and len(board.move_stack) < max_plies:
+        agent = agents[board.turn]
+        uci = agent.agent(board)
+        if len(board.move_stack) >= skip_plies and random.random() < sample_rate:
+            score = getattr(agent, "best_score", None)
+            samples.append(encode_position(board) + (np.nan if score is None else score,))
+        board.push_uci(uci)
+
+    records = np.zeros(len(samples), dtype=POSITION_DTYPE)
+    for i, (planes, features, score) in enumerate(samples):
+        records[i]["planes"] = planes
+        records[i]["features"] = features
+        records[i]["score"] = score
+    records["result"] = RESULTS[board.result(claim_draw=True)]
+    return records
+
+
+class ShardWriter:
+    """
+    Buffers position records and writes them as fixed size `.npy` shards.
+    """
+
+    def __init__(self, out_dir, shard_size):
+        """
+        shard writer constructor.
+        :param out_dir: str output directory, created if missing.
+        :param shard_size: int positions per shard.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.buffer = np.zeros(shard_size, dtype=POSITION_DTYPE)
+        self.count = 0
+        self.shards = list()
+
+    def add(self, records):
+        """
+        appends records, writing out every shard that fills up.
+        :param records: numpy array of POSITION_DTYPE records.
+        """
+        while len(records):
+            take = min(len(records), self.shard_size - self.count)
+            self.buffer[self.count:self.count + take] = records[:take]
+            self.count += take
+            records = records[take:]
+            if self.count == self.shard_size:
+                self.flush()
+
+    def flush(self):
+        """
+        writes the buffered records as a shard.
+        """
+        if self.count == 0:
+            return
+        name = "shard_%05d.npy" % len(self.shards)
+        shard = np.lib.format.open_memmap(os.path.join(self.out_dir, name), mode="w+",
+                                          dtype=POSITION_DTYPE, shape=(self.count,))
+        shard[:] = self.buffer[:self.count]
+        shard.flush()
+        del shard
+        self.shards.append({"file": name, "positions": self.count})
+        self.count = 0
+
+
+def generate(out_dir,
+             games,
+             white_spec="random",
+             black_spec="random",
+             workers=None,
+             sample_rate=0.25,
+             skip_plies=8,
+             max_plies=400,
+             shard_size=65536,
+             max_pending=None,
+             seed=0):
+    """
+    runs self-play games across worker processes into position shards.
+
+    At most max_pending games are in flight, so memory is bounded by those
+    games plus one shard buffer however many games are requested.
+
+    :param out_dir: str output directory.
+    :param games: int number of games to play.
+    :param white_spec: str agent spec of the white player.
+           default is "random".
+    :param black_spec: str agent spec of the black player.
+           default is "random".
+    :param workers: int worker processes.
+           default is None, one per CPU.
+    :param sample_rate: float probability a position is kept.
+           default is 0.25.
+    :param skip_plies: int opening plies never sampled.
+           default is 8.
+    :param max_plies: int plies after which a game is stopped as a draw.
+           default is 400.
+    :param shard_size: int positions per shard.
+           default is 65536.
+    :param max_pending: int games submitted but not yet written.
+           default is None, twice the number of workers.
+    :param seed: int base random seed, game i uses seed + i.
+           default is 0.
+    :return: dict manifest, also written to out_dir/manifest.json.
+    """
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 2 * workers
+    writer = ShardWriter(out_dir, shard_size)
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        for game in range(games):
+            if len(pending) >= max_pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    writer.add(future.result())
+            pending.add(pool.submit(play_selfplay_game, white_spec, black_spec,
+                                    sample_rate, skip_plies, max_plies, seed + game))
+        for future in concurrent.futures.as_completed(pending):
+            writer.add(future.result())
+    writer.flush()
+
+    manifest = {"dtype": [list(field) for field in POSITION_DTYPE.descr],
+                "white": white_spec,
+                "black": black_spec,
+                "games": games,
+                "sample_rate": sample_rate,
+                "skip_plies": skip_plies,
+                "seed": seed,
+                "positions": sum(shard["positions"] for shard in writer.shards),
+                "shards": writer.shards}
+    with open(os.path.join(out_dir, "manifest.json"), "w") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def load_shards(out_dir):
+    """
+    memory-maps every shard listed in a manifest.
+    :param out_dir: str directory holding manifest.json.
+    :return: list of read-only numpy memmaps of POSITION_DTYPE records.
+    """
+    with open(os.path.join(out_dir, "manifest.json")) as file:
+        manifest = json.load(file)
+    return [np.load(os.path.join(out_dir, shard["file"]), mmap_mode="r")
+            for shard in manifest["shards"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="generate self-play position datasets")
+    parser.add_argument("out_dir")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--white", default="random", help="agent spec, e.g. minimax:max_depth=1,heuristic=advanced")
+    parser.add_argument("--black", default="random", help="agent spec of the black player")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--sample-rate", type=float, default=0.25)
+    parser.add_argument("--skip-plies", type=int, default=8)
+    parser.add_argument("--max-plies", type=int, default=400)
+    parser.add_argument("--shard-size", type=int, default=65536)
+    parser.add_argument("--max-pending", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    manifest = generate(args.out_dir, args.games, args.white, args.black, args.workers,
+                        args.sample_rate, args.skip_plies, args.max_plies,
+                        args.shard_size, args.max_pending, args.seed)
+    print("%d positions in %d shards" % (manifest["positions"], len(manifest["shards"])))
+
+
+if __name__ == "__main__":
+    main()
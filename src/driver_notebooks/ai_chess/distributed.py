@@ -0,0 +1,364 @@
+"""
+Distributed match execution.
+
+A coordinator serves match jobs over TCP and workers on any number of hosts
+pull them, play them with Game.run or Game.run_engine and send the result
+rows back. Every request is one JSON line answered by one JSON line on its
+own connection:
+    {"op": "get", "worker": id}                 -> {"job": job or None, "done": bool}
+    {"op": "heartbeat", "worker": id}           -> {"ok": true}
+    {"op": "result", "worker": id, "job": id,
+     "rows": [...], "error": str or None}       -> {"ok": true, "duplicate": bool}
+
+A job is a dict with a unique "id", an "agent" spec for ai_chess.make_agent,
+an "opponent" that is either an agent spec or the path of a UCI engine, and
+optionally "games", "board_state" and "time_control".
+
+Delivery is at least once: a job whose worker stops sending heartbeats is
+handed out again, and a result for a job that already has one is dropped. A
+job that raises is answered with its error and no rows instead of being
+retried forever, and is run again when the coordinator is restarted on the
+same results file.
+Workers run whatever agents and engine paths their coordinator sends, so
+only point them at coordinators you trust.
+
+Run with `python -m ai_chess.distributed --help` from the driver_notebooks
+directory.
+"""
+import argparse
+import collections
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import uuid
+
+from ai_chess import AGENT_CLASSES, Game, make_agent
+
+
+def sweep_jobs(agents, opponents, games=1, board_state=None, time_control=None):
+    """
+    one job per game of every agent against every opponent.
+    :param agents: list of str agent specs.
+    :param opponents: list of str agent specs or UCI engine paths.
+    :param games: int games per pairing.
+           default is 1.
+    :param board_state: str start position in FEN standard or None.
+           default is None.
+    :param time_control: tuple (base, increment) in seconds or None.
+           default is None.
+    :return: list of job dicts.
+    """
+    jobs = list()
+    for agent in agents:
+        for opponent in opponents:
+            for game in range(games):
+                jobs.append({"id": "%s|%s|%d" % (agent, opponent, game),
+                             "agent": agent,
+                             "opponent": opponent,
+                             "games": 1,
+                             "board_state": board_state,
+                             "time_control": time_control})
+    return jobs
+
+
+def play_job(job):
+    """
+    plays the games of a job.
+    :param job: dict job.
+    :return: list of result rows as returned by Game.run or Game.run_engine.
+    """
+    agent = make_agent(job["agent"])
+    opponent = job["opponent"]
+    time_control = tuple(job["time_control"]) if job.get("time_control") else None
+    if opponent.partition(":")[0] in AGENT_CLASSES:
+        rows = Game().run(agent, make_agent(opponent), job.get("games", 1),
+                          job.get("board_state"), visual=None, time_control=time_control)
+    else:
+        rows = Game().run_engine(agent, opponent, job.get("games", 1),
+                                 job.get("board_state"), visual=None, time_control=time_control)
+    close = getattr(agent, "close", None)
+    if close is not None:
+        close()
+    return [list(row) for row in rows]
+
+
+class ReusableTCPServer(socketserver.ThreadingTCPServer):
+    """
+    Threading TCP server that can listen again on a port left in TIME_WAIT by
+    a coordinator that was just stopped.
+    """
+    allow_reuse_address = True
+
+
+class Coordinator:
+    """
+    Job queue served to workers over TCP.
+    """
+
+    def __init__(self, jobs, host="127.0.0.1", port=5555, heartbeat_timeout=30.0,
+                 out=None, on_result=None, retry_errors=True):
+        """
+        coordinator constructor.
+        :param jobs: list of job dicts with unique ids.
+        :param host: str interface to listen on, "0.0.0.0" for other hosts.
+               default is "127.0.0.1".
+        :param port: int TCP port, 0 picks a free one.
+               default is 5555.
+        :param heartbeat_timeout: float seconds without a heartbeat after which
+               a worker's jobs are handed out again.
+               default is 30.0.
+        :param out: str JSON lines file results are appended to as they arrive,
+               jobs already in it are not run again.
+               default is None.
+        :param on_result: callable(job, rows) called for every new result.
+               default is None.
+        :param retry_errors: boolean, jobs whose result in out is an error are
+               run again instead of being counted as done.
+               default is True.
+        """
+        self.jobs = collections.OrderedDict((job["id"], job) for job in jobs)
+        self.heartbeat_timeout = heartbeat_timeout
+        self.on_result = on_result
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self.results = dict()
+        self.errors = dict()
+        self.assigned = dict()
+        self.last_seen = dict()
+
+        self.out = None
+        if out is not None:
+            if os.path.exists(out):
+                with open(out) as file:
+                    for line in file:
+                        record = json.loads(line)
+                        if record.get("error") is not None:
+                            if retry_errors:
+                                continue
+                            self.errors[record["job"]] = record["error"]
+                        self.results[record["job"]] = record["rows"]
+            self.out = open(out, "a")
+        self.queue = collections.deque(job_id for job_id in self.jobs if job_id not in self.results)
+        if self.complete():
+            self.finished.set()
+
+        coordinator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                request = json.loads(self.rfile.readline())
+                response = coordinator.handle(request)
+                self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+        self.server = ReusableTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        """
+        starts serving in a background thread.
+        :return: the coordinator.
+        """
+        self.thread.start()
+        return self
+
+    def close(self):
+        """
+        stops serving and closes the results file.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        if self.out is not None:
+            self.out.close()
+
+    def complete(self):
+        """
+        checks whether every job of this sweep has a result, results of other
+        jobs read from a resumed out file are not counted.
+        :return: boolean.
+        """
+        return len(self.results.keys() & self.jobs.keys()) >= len(self.jobs)
+
+    def reclaim(self):
+        """
+        puts the jobs of workers that missed their heartbeats back in front of
+        the queue, called with the lock held.
+        """
+        now = time.time()
+        for job_id, worker in list(self.assigned.items()):
+            if now - self.last_seen.get(worker, 0) > self.heartbeat_timeout:
+                del self.assigned[job_id]
+                self.queue.appendleft(job_id)
+
+    def handle(self, request):
+        """
+        answers one worker request.
+        :param request: dict request.
+        :return: dict response.
+        """
+        worker = request.get("worker")
+        with self.lock:
+            self.last_seen[worker] = time.time()
+            if request["op"] == "get":
+                self.reclaim()
+                while self.queue:
+                    job_id = self.queue.popleft()
+                    if job_id not in self.results:
+                        self.assigned[job_id] = worker
+                        return {"job": self.jobs[job_id], "done": False}
+                return {"job": None, "done": self.finished.is_set()}
+
+            if request["op"] == "result":
+                job_id = request["job"]
+                if job_id in self.results or job_id not in self.jobs:
+                    return {"ok": True, "duplicate": True}
+                self.results[job_id] = request["rows"]
+                self.assigned.pop(job_id, None)
+                if request.get("error") is not None:
+                    self.errors[job_id] = request["error"]
+                if self.out is not None:
+                    self.out.write(json.dumps({"job": job_id, "rows": request["rows"],
+                                               "error": request.get("error")}) + "\n")
+                    self.out.flush()
+                if self.on_result is not None:
+                    self.on_result(self.jobs[job_id], request["rows"])
+                if self.complete():
+                    self.finished.set()
+                return {"ok": True, "duplicate": False}
+
+            return {"ok": True}
+
+    def wait(self, timeout=None):
+        """
+        blocks until every job has a result.
+        :param timeout: float seconds to wait or None.
+               default is None.
+        :return: list of result rows of all jobs, in job order.
+        """
+        self.finished.wait(timeout)
+        with self.lock:
+            return [row for job_id in self.jobs for row in self.results.get(job_id, [])]
+
+
+def request(host, port, message, retries=None, retry_delay=1.0):
+    """
+    sends one request to a coordinator, retrying until it is answered.
+    :param host: str coordinator host.
+    :param port: int coordinator port.
+    :param message: dict request.
+    :param retries: int attempts before giving up or None to keep trying.
+           default is None.
+    :param retry_delay: float seconds between attempts.
+           default is 1.0.
+    :return: dict response.
+    """
+    attempt = 0
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=30) as connection:
+                connection.sendall((json.dumps(message) + "\n").encode("utf-8"))
+                return json.loads(connection.makefile("r").readline())
+        except (OSError, ValueError):
+            attempt += 1
+            if retries is not None and attempt >= retries:
+                raise
+            time.sleep(retry_delay)
+
+
+def run_worker(host, port, worker_id=None, heartbeat_interval=5.0, poll_interval=1.0,
+               retries=60):
+    """
+    pulls and plays jobs until the coordinator has no work left.
+    :param host: str coordinator host.
+    :param port: int coordinator port.
+    :param worker_id: str worker name.
+           default is None, host name plus a random suffix.
+    :param heartbeat_interval: float seconds between heartbeats while playing.
+           default is 5.0.
+    :param poll_interval: float seconds to wait when no job is free yet.
+           default is 1.0.
+    :param retries: int attempts per request, one second apart, before the
+           coordinator is given up on.
+           default is 60.
+    :return: int number of jobs played.
+    """
+    worker_id = worker_id or "%s-%s" % (socket.gethostname(), uuid.uuid4().hex[:8])
+    played = 0
+    while True:
+        response = request(host, port, {"op": "get", "worker": worker_id}, retries)
+        job = response["job"]
+        if job is None:
+            if response["done"]:
+                return played
+            time.sleep(poll_interval)
+            continue
+
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(heartbeat_interval):
+                try:
+                    request(host, port, {"op": "heartbeat", "worker": worker_id}, retries=1)
+                except (OSError, ValueError):
+                    # a missed beat is retried at the next interval
+                    pass
+
+        heart = threading.Thread(target=beat, daemon=True)
+        heart.start()
+        rows, error = list(), None
+        try:
+            rows = play_job(job)
+        except Exception as exception:
+            error = repr(exception)
+        finally:
+            stop.set()
+            heart.join()
+        request(host, port, {"op": "result", "worker": worker_id, "job": job["id"],
+                             "rows": rows, "error": error}, retries)
+        played += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="distributed match execution")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    coordinator = commands.add_parser("coordinator", help="serve a sweep of match jobs")
+    coordinator.add_argument("--agents", required=True, help="semicolon separated agent specs")
+    coordinator.add_argument("--opponents", required=True, help="semicolon separated agent specs or engine paths")
+    coordinator.add_argument("--games", type=int, default=1, help="games per pairing")
+    coordinator.add_argument("--host", default="127.0.0.1")
+    coordinator.add_argument("--port", type=int, default=5555)
+    coordinator.add_argument("--heartbeat-timeout", type=float, default=30.0)
+    coordinator.add_argument("--out", required=True, help="JSON lines results file, resumed if it exists")
+    coordinator.add_argument("--keep-errors", action="store_true",
+                             help="do not run jobs again that failed in a resumed results file")
+
+    worker = commands.add_parser("worker", help="play jobs of a coordinator")
+    worker.add_argument("--host", default="127.0.0.1")
+    worker.add_argument("--port", type=int, default=5555)
+    worker.add_argument("--id", default=None)
+    args = parser.parse_args()
+
+    if args.command == "coordinator":
+        jobs = sweep_jobs(args.agents.split(";"), args.opponents.split(";"), args.games)
+        server = Coordinator(jobs, args.host, args.port, args.heartbeat_timeout, args.out,
+                             on_result=lambda job, rows: print(
+                                 ("failed " if job["id"] in server.errors else "done ") + job["id"],
+                                 flush=True),
+                             retry_errors=not args.keep_errors)
+        server.start()
+        print("serving %d jobs on %s:%d" % (len(jobs), server.address[0], server.address[1]), flush=True)
+        server.wait()
+        # let workers polling for work hear that everything is done
+        time.sleep(3)
+        server.close()
+    else:
+        print("played %d jobs" % run_worker(args.host, args.port, args.id))
+
+
+if __name__ == "__main__":
+    main()
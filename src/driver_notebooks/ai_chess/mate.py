@@ -0,0 +1,196 @@
+"""
+Mate-in-N solver built on proof-number search.
+
+The side to move is the attacker and only checking moves are tried for it,
+the defender may answer with every legal move. A position is proven once the
+defender is checkmated within the move limit and disproven when the defender
+escapes, is stalemated or the attacker runs out of checks or moves. The
+search tree is kept in memory and bounded by a node budget.
+
+Mates are looked for with increasing N, so the line returned is a shortest
+forced mate among checking lines.
+"""
+import time
+import chess
+
+INFINITY = 10 ** 9
+
+
+class ProofNode:
+    """
+    Node of the proof-number search tree.
+
+    OR nodes have the attacker to move and are proven by one proven child,
+    AND nodes have the defender to move and are proven once every child is.
+    """
+
+    def __init__(self, move, parent, is_or, ply, moves):
+        """
+        proof node constructor.
+        :param move: python-chess move leading to the node.
+        :param parent: ProofNode or None for the root.
+        :param is_or: boolean if the attacker is to move.
+        :param ply: int plies from the root.
+        :param moves: list of python-chess moves to expand, checks only at OR
+               nodes.
+        """
+        self.move = move
+        self.parent = parent
+        self.is_or = is_or
+        self.ply = ply
+        self.moves = moves
+        self.children = None
+        self.proof = 1
+        self.disproof = 1
+
+
+def checking_moves(board):
+    """
+    legal moves that give check.
+    :param board: a python-chess board.
+    :return: list of python-chess moves.
+    """
+    return [move for move in board.legal_moves if board.gives_check(move)]
+
+
+def make_node(board, move, parent, is_or, ply, max_plies):
+    """
+    creates a node for the position on the board and sets its initial proof
+    and disproof numbers, terminal positions are solved right away.
+    :param board: a python-chess board of the node's position.
+    :param move: python-chess move leading to the node.
+    :param parent: ProofNode or None.
+    :param is_or: boolean if the attacker is to move.
+    :param ply: int plies from the root.
+    :param max_plies: int plies the mate has to be delivered in.
+    :return: ProofNode.
+    """
+    if is_or:
+        moves = checking_moves(board) if ply < max_plies else []
+        node = ProofNode(move, parent, is_or, ply, moves)
+        if not moves or board.is_insufficient_material():
+            node.proof, node.disproof = INFINITY, 0
+        else:
+            node.proof, node.disproof = 1, len(moves)
+        return node
+
+    moves = list(board.legal_moves)
+    node = ProofNode(move, parent, is_or, ply, moves)
+    if not moves:
+        if board.is_check():
+            node.proof, node.disproof = 0, INFINITY
+        else:
+            node.proof, node.disproof = INFINITY, 0
+    elif ply >= max_plies:
+        node.proof, node.disproof = INFINITY, 0
+    else:
+        # fewer replies are easier to refute
+        node.proof, node.disproof = len(moves), 1
+    return node
+
+
+def update(node):
+    """
+    recomputes proof and disproof numbers from the children up to the root.
+    :param node: ProofNode whose children changed.
+    """
+    while node is not None:
+        proofs = [child.proof for child in node.children]
+        disproofs = [child.disproof for child in node.children]
+        if node.is_or:
+            proof, disproof = min(proofs), min(sum(disproofs), INFINITY)
+        else:
+            proof, disproof = min(sum(proofs), INFINITY), min(disproofs)
+        if (proof, disproof) == (node.proof, node.disproof):
+            return
+        node.proof, node.disproof = proof, disproof
+        node = node.parent
+
+
+def mate_distance(node):
+    """
+    plies to mate of a proven node with best play, the attacker taking the
+    fastest proven move and the defender the slowest.
+    :param node: proven ProofNode.
+    :return: int plies.
+    """
+    if not node.children:
+        return 0
+    distances = [mate_distance(child) + 1 for child in node.children if child.proof == 0]
+    return min(distances) if node.is_or else max(distances)
+
+
+def mate_line(node):
+    """
+    principal variation of a proven node.
+    :param node: proven ProofNode.
+    :return: list of python-chess moves.
+    """
+    line = list()
+    while node.children:
+        proven = [child for child in node.children if child.proof == 0]
+        pick = min if node.is_or else max
+        node = pick(proven, key=mate_distance)
+        line.append(node.move)
+    return line
+
+
+def prove(board, max_plies, max_nodes, deadline=None):
+    """
+    proof-number search for a mate within a number of plies.
+    :param board: a python-chess board, the side to move attacks.
+    :param max_plies: int plies the mate has to be delivered in.
+    :param max_nodes: int nodes the tree may grow to.
+    :param deadline: float time.time() at which the search gives up.
+           default is None, no time limit.
+    :return: tuple (root ProofNode, int nodes created).
+    """
+    root = make_node(board, None, None, True, 0, max_plies)
+    nodes = 1
+    while root.proof != 0 and root.disproof != 0 and nodes < max_nodes:
+        if deadline is not None and time.time() >= deadline:
+            break
+        # walk to the most proving node
+        node = root
+        path = board.copy(stack=False)
+        while node.children is not None:
+            if node.is_or:
+                node = min(node.children, key=lambda child: child.proof)
+            else:
+                node = min(node.children, key=lambda child: child.disproof)
+            path.push(node.move)
+
+        node.children = list()
+        for move in node.moves:
+            path.push(move)
+            node.children.append(make_node(path, move, node, not node.is_or, node.ply + 1, max_plies))
+            path.pop()
+        nodes += len(node.children)
+        update(node)
+    return (root, nodes)
+
+
+def solve(board, max_moves=3, max_nodes=20000, time_limit=None):
+    """
+    looks for a forced mate by checks for the side to move.
+    :param board: a python-chess board.
+    :param max_moves: int longest mate searched for, in attacker moves.
+           default is 3.
+    :param max_nodes: int nodes the search may create over all move limits.
+           default is 20000.
+    :param time_limit: float seconds the search may take.
+           default is None, no time limit.
+    :return: tuple (line, plies) of the mating line as a list of uci strings
+            and its length in plies, or None if no mate was proven.
+    """
+    deadline = time.time() + time_limit if time_limit is not None else None
+    if not checking_moves(board):
+        return None
+    for moves in range(1, max_moves + 1):
+        root, nodes = prove(board, 2 * moves - 1, max_nodes, deadline)
+        max_nodes -= nodes
+        if root.proof == 0:
+            return ([move.uci() for move in mate_line(root)], mate_distance(root))
+        if max_nodes <= 0 or (deadline is not None and time.time() >= deadline):
+            break
+    return None
@@ -0,0 +1,248 @@
+"""
+Tactical test-suite benchmark.
+
+Runs an agent over an EPD suite whose records carry `bm` (best move) and/or
+`am` (avoid move) opcodes and reports the solve rate at several time or node
+budgets together with the time and nodes to solution.
+
+Each position is searched once by iterative deepening up to the largest
+budget. The best move after every completed depth is kept with the time and
+nodes spent so far, and the answer at a smaller budget is the one of the
+last depth completed within it. A position counts as solved at a budget when
+that answer matches bm and avoids am, and its time (nodes) to solution is the
+point from which the answer stayed correct.
+
+Reports can be saved as JSON and diffed against a saved baseline. Run with
+`python -m ai_chess.suite --help` from the driver_notebooks directory.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+import chess
+
+from ai_chess import SearchStopped, make_agent
+from ai_chess.analysis import DEFAULT_AGENT, read_positions
+
+
+def read_suite(path):
+    """
+    reads an EPD suite. Lines that cannot be read and records with neither a
+    bm nor an am opcode are skipped with a message, as they have no solution
+    to check.
+    :param path: str EPD file path.
+    :return: list of dicts with index, id, fen, bm and am as lists of uci
+            strings.
+    """
+    suite = list()
+    for index, position_id, fen, operations in read_positions(path):
+        position_id = position_id or str(index + 1)
+        if "error" in operations:
+            print("skipped %s: %s" % (position_id, operations["error"]), file=sys.stderr)
+            continue
+        record = {"index": index,
+                  "id": position_id,
+                  "fen": fen,
+                  "bm": [move.uci() for move in operations.get("bm", [])],
+                  "am": [move.uci() for move in operations.get("am", [])]}
+        if not record["bm"] and not record["am"]:
+            print("skipped %s: no bm or am opcode" % position_id, file=sys.stderr)
+            continue
+        suite.append(record)
+    return suite
+
+
+def is_solution(move, position):
+    """
+    checks a move against the bm and am opcodes of a position.
+    :param move: str uci move or None.
+    :param position: dict suite record.
+    :return: boolean.
+    """
+    if move is None or not (position["bm"] or position["am"]):
+        return False
+    if position["bm"] and move not in position["bm"]:
+        return False
+    return move not in position["am"]
+
+
+def run_position(agent_spec, position, max_time=None, max_nodes=None):
+    """
+    searches one position by iterative deepening with a fresh agent.
+    :param agent_spec: str agent spec for ai_chess.make_agent.
+    :param position: dict suite record.
+    :param max_time: float seconds of the largest time budget or None.
+    :param max_nodes: int nodes of the largest node budget or None.
+    :return: list of [seconds, nodes, depth, uci move] after every completed
+            depth.
+    """
+    agent = make_agent(agent_spec)
+    board = chess.Board(position["fen"])
+    start = time.time()
+    if not hasattr(agent, "set_max_depth"):
+        best = agent.agent(board)
+        return [[time.time() - start, getattr(agent, "nodes", 0), 1, best]]
+
+    trajectory = list()
+    agent.nodes = 0
+    agent.stop = lambda: ((max_time is not None and time.time() - start >= max_time) or
+                          (max_nodes is not None and agent.nodes >= max_nodes))
+    try:
+        for depth in range(1, 65):
+            agent.set_max_depth(depth - 1)
+            best = agent.agent(board.copy())
+            trajectory.append([time.time() - start, agent.nodes, depth, best])
+            if agent.mate_line is not None or agent.book_move(board) is not None:
+                break
+    except SearchStopped:
+        pass
+    finally:
+        agent.stop = None
+    return trajectory
+
+
+def score_budget(position, trajectory, budget, measure):
+    """
+    result of a position at one budget.
+    :param position: dict suite record.
+    :param trajectory: list of [seconds, nodes, depth, move] entries.
+    :param budget: float seconds or int nodes.
+    :param measure: int 0 for time budgets, 1 for node budgets.
+    :return: dict with move, solved, and seconds, nodes and depth to solution.
+    """
+    within = [entry for entry in trajectory if entry[measure] <= budget]
+    result = {"move": within[-1][3] if within else None, "solved": False,
+              "time": None, "nodes": None, "depth": None}
+    if within and is_solution(within[-1][3], position):
+        first = len(within) - 1
+        while first > 0 and is_solution(within[first - 1][3], position):
+            first -= 1
+        result.update(solved=True, time=within[first][0], nodes=within[first][1],
+                      depth=within[first][2])
+    return result
+
+
+def run_suite(suite, agent_spec=DEFAULT_AGENT, times=None, nodes=None, workers=None):
+    """
+    runs a suite at time or node budgets.
+    :param suite: list of suite records from read_suite.
+    :param agent_spec: str agent spec for ai_chess.make_agent.
+           default is an alpha-beta agent with the advanced heuristic.
+    :param times: list of float second budgets.
+           default is None.
+    :param nodes: list of int node budgets, used when times is not given.
+           default is None.
+    :param workers: int worker processes.
+           default is None, one per CPU.
+    :return: dict report with the agent, budgets, per budget summary and per
+            position results.
+    """
+    measure, budgets = (0, sorted(times)) if times else (1, sorted(nodes))
+    max_time = budgets[-1] if measure == 0 else None
+    max_nodes = budgets[-1] if measure == 1 else None
+
+    with concurrent.futures.ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+        futures = [pool.submit(run_position, agent_spec, position, max_time, max_nodes)
+                   for position in suite]
+
+    positions = list()
+    for position, future in zip(suite, futures):
+        entry = {"id": position["id"], "fen": position["fen"]}
+        try:
+            trajectory = future.result()
+        except Exception as error:
+            # counted as unsolved at every budget
+            trajectory = list()
+            entry["error"] = repr(error)
+        entry["results"] = {str(budget): score_budget(position, trajectory, budget, measure)
+                            for budget in budgets}
+        positions.append(entry)
+
+    summary = list()
+    for budget in budgets:
+        solved = [entry["results"][str(budget)] for entry in positions
+                  if entry["results"][str(budget)]["solved"]]
+        summary.append({"budget": budget,
+                        "solved": len(solved),
+                        "rate": len(solved) / max(len(positions), 1),
+                        "mean_time": sum(r["time"] for r in solved) / len(solved) if solved else None,
+                        "mean_nodes": sum(r["nodes"] for r in solved) / len(solved) if solved else None})
+
+    return {"agent": agent_spec,
+            "budget": "time" if measure == 0 else "nodes",
+            "budgets": budgets,
+            "positions": positions,
+            "summary": summary}
+
+
+def report(result):
+    """
+    prints the solve rate curve of a suite run.
+    :param result: dict report from run_suite.
+    """
+    errors = sum("error" in entry for entry in result["positions"])
+    print("%s, %d positions, %d errors" % (result["agent"], len(result["positions"]), errors))
+    print("%12s %8s %7s %12s %12s" % (result["budget"], "solved", "rate", "mean time", "mean nodes"))
+    for row in result["summary"]:
+        print("%12s %8d %6.1f%% %12s %12s" % (
+            row["budget"], row["solved"], 100 * row["rate"],
+            "-" if row["mean_time"] is None else "%.4fs" % row["mean_time"],
+            "-" if row["mean_nodes"] is None else "%.0f" % row["mean_nodes"]))
+
+
+def diff(result, baseline):
+    """
+    prints the changes of a suite run against a saved baseline run.
+    :param result: dict report from run_suite.
+    :param baseline: dict report from an earlier run_suite.
+    """
+    print("against baseline %s" % baseline["agent"])
+    rows = {str(row["budget"]): row for row in baseline["summary"]}
+    for row in result["summary"]:
+        old = rows.get(str(row["budget"]))
+        if old is None:
+            continue
+        print("%12s solved %+d (%d -> %d)" % (row["budget"], row["solved"] - old["solved"],
+                                              old["solved"], row["solved"]))
+
+    old_positions = {entry["id"]: entry for entry in baseline["positions"]}
+    budget = str(result["budgets"][-1])
+    for entry in result["positions"]:
+        old = old_positions.get(entry["id"])
+        if old is None or budget not in old["results"]:
+            continue
+        now, before = entry["results"][budget], old["results"][budget]
+        if now["solved"] != before["solved"]:
+            print("  %s %s at %s (%s, was %s)" % (entry["id"], "gained" if now["solved"] else "lost",
+                                                 budget, now["move"], before["move"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run an EPD tactical suite at several budgets")
+    parser.add_argument("suite", help="EPD file with bm and/or am opcodes")
+    parser.add_argument("--agent", default=DEFAULT_AGENT, help="agent spec, e.g. " + DEFAULT_AGENT)
+    parser.add_argument("--times", default=None, help="comma separated second budgets, e.g. 0.1,0.5,1")
+    parser.add_argument("--nodes", default=None, help="comma separated node budgets, e.g. 1000,10000")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--save", default=None, help="JSON file to save the report to")
+    parser.add_argument("--baseline", default=None, help="saved JSON report to diff against")
+    args = parser.parse_args()
+
+    times = [float(value) for value in args.times.split(",")] if args.times else None
+    nodes = [int(value) for value in args.nodes.split(",")] if args.nodes else None
+    if times is None and nodes is None:
+        times = [0.1, 0.5, 1.0]
+    result = run_suite(read_suite(args.suite), args.agent, times, nodes, args.workers)
+    report(result)
+    if args.baseline:
+        with open(args.baseline) as file:
+            diff(result, json.load(file))
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(result, file, indent=1)
+
+
+if __name__ == "__main__":
+    main()
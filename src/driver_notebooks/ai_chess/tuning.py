@@ -0,0 +1,229 @@
+"""
+Texel-style tuning of the advanced evaluation's piece values and
+piece-square tables.
+
+Positions come from ai_chess.datagen shards. Every position is turned once
+into a sparse row of at most 32 feature indices, one per piece: white piece
+p on square s is feature p * 64 + s, black piece p on s is feature
+384 + p * 64 + mirror(s), and unused slots point at a padding feature. With
+a weight vector w of combined value + table entries the white point of view
+evaluation of all positions is `concat(w, -w, [0])[indices].sum(1)`, and the
+gradient is a single `numpy.bincount` over the same indices.
+
+Run with `python -m ai_chess.tuning --help` from the driver_notebooks
+directory, then load the written tables with `ai_chess.load_tables`.
+"""
+import argparse
+import json
+import math
+import chess
+import numpy as np
+
+from ai_chess import piece_values, piece_tables, table_names
+from ai_chess.datagen import load_shards
+
+MAX_PIECES = 32
+FEATURES = 6 * 64
+PADDING = 2 * FEATURES
+
+
+def position_indices(records):
+    """
+    sparse feature indices of datagen position records.
+    :param records: numpy array of ai_chess.datagen.POSITION_DTYPE records.
+    :return: int16 array (positions, 32) of feature indices.
+    """
+    planes = np.unpackbits(records["planes"], axis=-1, bitorder="little")
+    white = planes[:, :6].reshape(len(records), FEATURES)
+    # square_mirror flips the rank, i.e. reverses the 8 rows of a plane
+    black = planes[:, 6:].reshape(len(records), 6, 8, 8)[:, :, ::-1, :].reshape(len(records), FEATURES)
+    rows, columns = np.nonzero(np.concatenate([white, black], axis=1))
+
+    counts = np.bincount(rows, minlength=len(records))
+    starts = np.cumsum(counts) - counts
+    slots = np.arange(len(rows)) - np.repeat(starts, counts)
+
+    indices = np.full((len(records), MAX_PIECES), PADDING, dtype=np.int16)
+    keep = slots < MAX_PIECES
+    indices[rows[keep], slots[keep]] = columns[keep]
+    return indices
+
+
+def load_dataset(data_dir):
+    """
+    feature indices and labels of every position in a dataset.
+    :param data_dir: str directory written by ai_chess.datagen.
+    :return: tuple (indices, results, scores) where results are white's game
+            scores (1, 0.5, 0) and scores the search scores.
+    """
+    indices = list()
+    results = list()
+    scores = list()
+    for shard in load_shards(data_dir):
+        indices.append(position_indices(shard))
+        results.append((shard["result"].astype(np.float64) + 1) / 2)
+        scores.append(shard["score"].astype(np.float64))
+    return (np.concatenate(indices), np.concatenate(results), np.concatenate(scores))
+
+
+def initial_weights():
+    """
+    combined piece value + table weights of the current evaluation.
+    :return: float array of 384 weights.
+    """
+    weights = np.zeros(FEATURES)
+    for piece_type in chess.PIECE_TYPES:
+        start = (piece_type - 1) * 64
+        weights[start:start + 64] = piece_values[piece_type] + np.array(piece_tables[piece_type])
+    return weights
+
+
+def evaluate(weights, indices):
+    """
+    white point of view evaluation of positions.
+    :param weights: float array of 384 weights.
+    :param indices: int16 array of feature indices.
+    :return: float array of evaluations.
+    """
+    signed = np.concatenate([weights, -weights, [0.0]])
+    return signed[indices].sum(axis=1)
+
+
+def targets(results, scores, score_weight, scaling):
+    """
+    expected score targets blending game results and search scores.
+    :param results: float array of white's game scores (1, 0.5, 0).
+    :param scores: float array of search scores, NaN where missing.
+    :param score_weight: float share of the search score.
+    :param scaling: float logistic scaling per centipawn.
+    :return: float array of targets.
+    """
+    if score_weight == 0:
+        return results
+    blended = (1 - score_weight) * results + score_weight / (1 + np.exp(-scaling * np.nan_to_num(scores)))
+    return np.where(np.isnan(scores), results, blended)
+
+
+def loss(weights, indices, target, scaling):
+    """
+    mean logistic loss of the evaluation against the targets.
+    :param weights: float array of 384 weights.
+    :param indices: int16 array of feature indices.
+    :param target: float array of targets.
+    :param scaling: float logistic scaling per centipawn.
+    :return: float loss.
+    """
+    p = 1 / (1 + np.exp(-scaling * evaluate(weights, indices)))
+    p = np.clip(p, 1e-9, 1 - 1e-9)
+    return float(-np.mean(target * np.log(p) + (1 - target) * np.log(1 - p)))
+
+
+def fit_scaling(weights, indices, results):
+    """
+    Texel constant K of the current weights, searched over a grid.
+    :param weights: float array of 384 weights.
+    :param indices: int16 array of feature indices.
+    :param results: float array of white's game scores.
+    :return: float logistic scaling per centipawn, K * ln(10) / 400.
+    """
+    grid = [k * math.log(10) / 400 for k in np.linspace(0.1, 3.0, 30)]
+    return min(grid, key=lambda scaling: loss(weights, indices, results, scaling))
+
+
+def tune(weights, indices, target, scaling, epochs=100, learning_rate=1.0,
+         batch_size=262144, seed=0, verbose=False):
+    """
+    fits the weights with mini-batch Adam on the logistic loss.
+    :param weights: float array of 384 starting weights.
+    :param indices: int16 array of feature indices.
+    :param target: float array of targets.
+    :param scaling: float logistic scaling per centipawn.
+    :param epochs: int passes over the data.
+           default is 100.
+    :param learning_rate: float Adam step size in centipawns.
+           default is 1.0.
+    :param batch_size: int positions per gradient step.
+           default is 262144.
+    :param seed: int shuffling seed.
+           default is 0.
+    :param verbose: boolean print the loss after every epoch.
+           default is False.
+    :return: float array of tuned weights.
+    """
+    rng = np.random.default_rng(seed)
+    weights = weights.copy()
+    m = np.zeros_like(weights)
+    v = np.zeros_like(weights)
+    step = 0
+    for epoch in range(epochs):
+        order = rng.permutation(len(target))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            batch_indices = indices[batch]
+            p = 1 / (1 + np.exp(-scaling * evaluate(weights, batch_indices)))
+            delta = scaling * (p - target[batch]) / len(batch)
+            counts = np.bincount(batch_indices.ravel(),
+                                 weights=np.repeat(delta, MAX_PIECES),
+                                 minlength=PADDING + 1)
+            gradient = counts[:FEATURES] - counts[FEATURES:PADDING]
+
+            step += 1
+            m = 0.9 * m + 0.1 * gradient
+            v = 0.999 * v + 0.001 * gradient ** 2
+            m_hat = m / (1 - 0.9 ** step)
+            v_hat = v / (1 - 0.999 ** step)
+            weights -= learning_rate * m_hat / (np.sqrt(v_hat) + 1e-12)
+        if verbose:
+            print("epoch %d loss %.6f" % (epoch + 1, loss(weights, indices, target, scaling)))
+    return weights
+
+
+def split_weights(weights, indices):
+    """
+    splits combined weights into piece values and piece-square tables.
+
+    A piece value moves by the mean change of its table over the squares
+    the data covers, so the tables keep their original level.
+    :param weights: float array of 384 tuned weights.
+    :param indices: int16 array of feature indices.
+    :return: dict in the format read by ai_chess.load_tables.
+    """
+    seen = np.bincount(indices.ravel(), minlength=PADDING + 1)
+    seen = (seen[:FEATURES] + seen[FEATURES:PADDING]) > 0
+    change = weights - initial_weights()
+    tables = {"piece_values": dict()}
+    for name, piece_type in table_names.items():
+        start = (piece_type - 1) * 64
+        squares = seen[start:start + 64]
+        value = piece_values[piece_type]
+        if piece_type != chess.KING and squares.any():
+            value += change[start:start + 64][squares].mean()
+        tables["piece_values"][chess.PIECE_NAMES[piece_type]] = int(round(value))
+        tables[name] = [int(round(w - value)) for w in weights[start:start + 64]]
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tune piece values and piece-square tables")
+    parser.add_argument("data_dir", help="directory written by ai_chess.datagen")
+    parser.add_argument("out", help="JSON table file to write")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--learning-rate", type=float, default=1.0)
+    parser.add_argument("--batch-size", type=int, default=262144)
+    parser.add_argument("--score-weight", type=float, default=0.0)
+    args = parser.parse_args()
+
+    indices, results, scores = load_dataset(args.data_dir)
+    weights = initial_weights()
+    scaling = fit_scaling(weights, indices, results)
+    target = targets(results, scores, args.score_weight, scaling)
+    print("%d positions, K = %.3f, loss %.6f" % (len(target), scaling * 400 / math.log(10),
+                                                 loss(weights, indices, target, scaling)))
+    weights = tune(weights, indices, target, scaling, args.epochs, args.learning_rate,
+                   args.batch_size, verbose=True)
+    with open(args.out, "w") as file:
+        json.dump(split_weights(weights, indices), file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Universal Chess Interface (UCI) front-end for the agents.
+
+Run with `python -m ai_chess.uci` from the driver_notebooks directory and
+register that command as an engine in a tournament manager or GUI.
+"""
+import sys
+import threading
+import time
+import chess
+
+from ai_chess import BaseAgent, MiniMaxAgent, SearchStopped, TimeManager
+
+ENGINE_NAME = "ai-chess-agent"
+ENGINE_AUTHOR = "ai-chess-agent contributors"
+
+# rough number of hash move table entries that fit in one megabyte
+HASH_ENTRIES_PER_MB = 4096
+
+
+class UciEngine:
+    """
+    UCI protocol driver wrapping a MiniMaxAgent or BaseAgent.
+
+    Searches run on their own thread so commands such as stop and isready are
+    answered while the agent is thinking. Depths are given in plies, a search
+    to depth N runs MiniMaxAgent with max_depth N - 1.
+    """
+
+    def __init__(self, output=sys.stdout):
+        """
+        uci engine constructor.
+        :param output: file-like object the protocol responses are written to.
+               default is sys.stdout.
+        """
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.board = chess.Board()
+        self.options = {"Hash": 16,
+                        "Threads": 1,
+                        "Heuristic": "advanced",
+                        "Agent": "alpha-beta",
+                        "Depth": 2,
+                        "BookFile": "",
+                        "MateSearch": 0}
+        self.agent = None
+        self.search_thread = None
+        self.stop_event = threading.Event()
+
+    def send(self, line):
+        """
+        writes one protocol line.
+        :param line: str response without line terminator.
+        """
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def build_agent(self):
+        """
+        creates the agent described by the current options.
+        :return: MiniMaxAgent or BaseAgent.
+        """
+        heuristic = self.options["Heuristic"]
+        if self.options["Agent"] == "base":
+            # the base agent has no bitboard kernel, it scores the same as advanced
+            return BaseAgent(heuristic="advanced" if heuristic == "bitboard" else heuristic)
+        return MiniMaxAgent(max_depth=self.options["Depth"] - 1,
+                            heuristic=heuristic,
+                            type=self.options["Agent"],
+                            hash_size=self.options["Hash"] * HASH_ENTRIES_PER_MB,
+                            book=self.options["BookFile"] or None,
+                            mate_search=self.options["MateSearch"])
+
+    def uci(self):
+        """
+        identifies the engine and lists its options.
+        """
+        self.send("id name " + ENGINE_NAME)
+        self.send("id author " + ENGINE_AUTHOR)
+        self.send("option name Hash type spin default 16 min 1 max 1024")
+        # the search is single threaded, the option only exists so managers
+        # that always send it are not rejected
+        self.send("option name Threads type spin default 1 min 1 max 512")
+        self.send("option name Heuristic type combo default advanced "
+                  "var naive var improved var advanced var bitboard")
+        self.send("option name Agent type combo default alpha-beta "
+                  "var alpha-beta var minimax var base")
+        self.send("option name Depth type spin default 2 min 1 max 64")
+        self.send("option name BookFile type string default <empty>")
+        self.send("option name MateSearch type spin default 0 min 0 max 8")
+        self.send("uciok")
+
+    def setoption(self, tokens):
+        """
+        handles `setoption name <id> [value <x>]`.
+        :param tokens: list of str command tokens after setoption.
+        """
+        if "name" not in tokens:
+            return
+        name_end = tokens.index("value") if "value" in tokens else len(tokens)
+        name = " ".join(tokens[tokens.index("name") + 1:name_end])
+        value = " ".join(tokens[name_end + 1:])
+        for option in self.options:
+            if option.lower() == name.lower():
+                if isinstance(self.options[option], int):
+                    try:
+                        value = int(value)
+                    except ValueError:
+                        self.send("info string invalid value %r for option %s" % (value, option))
+                        return
+                    self.options[option] = max(0 if option == "MateSearch" else 1, value)
+                else:
+                    self.options[option] = "" if value == "<empty>" else value
+                self.agent = None
+                return
+        self.send("info string unknown option " + name)
+
+    def position(self, tokens):
+        """
+        handles `position [startpos | fen <fen>] [moves <move> ...]`, a bad
+        fen or move is reported and the command ignored.
+        :param tokens: list of str command tokens after position.
+        """
+        moves_at = tokens.index("moves") if "moves" in tokens else len(tokens)
+        try:
+            if tokens and tokens[0] == "fen":
+                board = chess.Board(" ".join(tokens[1:moves_at]))
+            else:
+                board = chess.Board()
+            for uci in tokens[moves_at + 1:]:
+                board.push_uci(uci)
+        except ValueError as error:
+            self.send("info string invalid position: %s" % error)
+            return
+        self.board = board
+
+    def go(self, tokens):
+        """
+        handles `go` by starting a search thread.
+        :param tokens: list of str command tokens after go.
+        """
+        self.stop_search()
+        limits = dict()
+        for i, token in enumerate(tokens):
+            if token in ("depth", "movetime", "wtime", "btime", "winc", "binc",
+                         "movestogo", "nodes") and i + 1 < len(tokens):
+                try:
+                    limits[token] = int(tokens[i + 1])
+                except ValueError:
+                    self.send("info string invalid value %r for %s" % (tokens[i + 1], token))
+            elif token == "infinite":
+                limits[token] = True
+        if self.agent is None:
+            self.agent = self.build_agent()
+        self.stop_event.clear()
+        self.search_thread = threading.Thread(target=self.search,
+                                              args=(self.board.copy(), limits),
+                                              daemon=True)
+        self.search_thread.start()
+
+    def move_time(self, board, limits):
+        """
+        soft and hard seconds available for this move from movetime or the
+        clock.
+        :param board: a python-chess board.
+        :param limits: dict of go parameters.
+        :return: tuple (soft, hard) in seconds or None if unlimited.
+        """
+        if "movetime" in limits:
+            return (limits["movetime"] / 1000.0, limits["movetime"] / 1000.0)
+        remaining = limits.get("wtime" if board.turn == chess.WHITE else "btime")
+        if remaining is None:
+            return None
+        increment = limits.get("winc" if board.turn == chess.WHITE else "binc", 0)
+        time_manager = getattr(self.agent, "time_manager", None) or TimeManager()
+        if "movestogo" in limits:
+            time_manager = TimeManager(moves_to_go=limits["movestogo"],
+                                       min_moves_to_go=min(limits["movestogo"], time_manager.min_moves_to_go))
+        return time_manager.budget(remaining / 1000.0, increment / 1000.0, board.fullmove_number)
+
+    def search(self, board, limits):
+        """
+        runs an iterative deepening search and reports bestmove.
+        :param board: a python-chess board.
+        :param limits: dict of go parameters.
+        """
+        agent = self.agent
+        start = time.time()
+        move_time = self.move_time(board, limits)
+        deadline = start + move_time[1] if move_time is not None else None
+        node_limit = limits.get("nodes")
+        if "depth" in limits:
+            max_depth = limits["depth"]
+        elif "infinite" in limits or move_time is not None or node_limit is not None:
+            max_depth = 64
+        else:
+            max_depth = self.options["Depth"]
+
+        def stop():
+            return (self.stop_event.is_set() or
+                    (deadline is not None and time.time() >= deadline) or
+                    (node_limit is not None and agent.nodes >= node_limit))
+
+        legal = list(board.legal_moves)
+        best = legal[0].uci() if legal else "0000"
+        book_move = agent.book_move(board) if isinstance(agent, MiniMaxAgent) else None
+
+        if book_move is not None:
+            best = book_move
+            self.send("info string book move " + book_move)
+        elif legal and isinstance(agent, BaseAgent):
+            best = agent.agent(board.copy())
+            self.info(1, len(legal), start)
+        elif legal:
+            agent.nodes = 0
+            agent.stop = stop
+            try:
+                for depth in range(1, max_depth + 1):
+                    agent.set_max_depth(depth - 1)
+                    best = agent.agent(board.copy())
+                    if agent.mate_line is not None:
+                        self.info(depth, agent.nodes, start, pv=" ".join(agent.mate_line),
+                                  mate=(agent.mate_distance + 1) // 2)
+                        break
+                    score = agent.best_score if board.turn == chess.WHITE else -agent.best_score
+                    self.info(depth, agent.nodes, start, score, best)
+                    if move_time is not None and time.time() - start >= move_time[0]:
+                        break
+            except SearchStopped:
+                pass
+            finally:
+                agent.stop = None
+
+        # an infinite search only reports its move once the gui says stop
+        if "infinite" in limits:
+            self.stop_event.wait()
+        self.send("bestmove " + best)
+
+    def info(self, depth, nodes, start, score=None, pv=None, mate=None):
+        """
+        reports search progress.
+        :param depth: int completed depth in plies.
+        :param nodes: int nodes searched.
+        :param start: float search start time.
+        :param score: int centipawn score from the side to move or None.
+        :param pv: str best move in uci or None.
+        :param mate: int moves to a proven mate or None.
+        """
+        elapsed = max(time.time() - start, 1e-6)
+        line = "info depth %d" % depth
+        if mate is not None:
+            line += " score mate %d" % mate
+        elif score is not None:
+            line += " score cp %d" % int(score)
+        line += " nodes %d nps %d time %d" % (nodes, nodes / elapsed, elapsed * 1000)
+        if pv is not None:
+            line += " pv " + pv
+        self.send(line)
+
+    def stop_search(self):
+        """
+        stops a running search and waits for its bestmove.
+        """
+        if self.search_thread is not None:
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+    def handle(self, line):
+        """
+        dispatches one protocol command.
+        :param line: str command line.
+        :return: boolean False once quit was received.
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            self.uci()
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.setoption(args)
+        elif command == "ucinewgame":
+            self.stop_search()
+            self.agent = None
+            self.board = chess.Board()
+        elif command == "position":
+            self.position(args)
+        elif command == "go":
+            self.go(args)
+        elif command == "stop":
+            self.stop_search()
+        elif command == "quit":
+            self.stop_search()
+            return False
+        return True
+
+    def run(self, input=sys.stdin):
+        """
+        reads commands until quit or end of input.
+        :param input: file-like object commands are read from.
+               default is sys.stdin.
+        """
+        for line in input:
+            if not self.handle(line.strip()):
+                break
+        self.stop_search()
+
+
+def main():
+    UciEngine().run()
+
+
+if __name__ == "__main__":
+    main()